@@ -1,13 +1,18 @@
-import aiohttp_cors
+import json
+from time import perf_counter
+
+_started = perf_counter()
+
+import aiohttp_cors  # pylint: disable=wrong-import-position
 from aiofauna import *
-from aiohttp.web import HTTPFound, HTTPNotFound
+from aiohttp.web import HTTPFound, HTTPNotFound, Request, Response
 from aiohttp_sse import EventSourceResponse
-from boto3 import Session
 from dotenv import load_dotenv
 
 from .config import *
 from .data import *
 from .helpers import *
+from .lazy import *
 from .routes import *
 from .schemas import *
 from .services import *
@@ -17,9 +22,12 @@ from .utils import *
 
 load_dotenv()
 
+warmup.import_seconds = perf_counter() - _started
+logger = setup_logging(__name__)
+logger.info("Imported aio_agents in %.3fs", warmup.import_seconds)
 
 llm = LLMStack()
-s3 = Session().client("s3")
+s3 = aws_client("s3")
 app = APIServer(servers=[{"url": "https://www.aiofauna.com"}], client_max_size=2**22)
 
 
@@ -29,24 +37,58 @@ def create_app():
         return Response(text=open("static/index.html").read(), content_type="text/html")
 
     @app.sse("/api/chat/{namespace}")
-    async def chat_endpoint(text: str, namespace: str, sse: EventSourceResponse):
-        async for response in llm.stream_chat_with_memory(text, namespace):
-            await sse.send(response)
+    async def chat_endpoint(
+        text: str, namespace: str, sse: EventSourceResponse, request: Request
+    ):
+        # ?format=html streams rendered markdown as reset/commit/pending events
+        # instead of the raw text chunks.
+        markdown = (
+            IncrementalMarkdown()
+            if query_param(request, "format", "") == "html"
+            else None
+        )
+        # The client posted `text` already, it is sent once as the prompt.
+        history = (await conversations.get(namespace)).messages(text)
+        with priority_class(Priority.INTERACTIVE):
+            async for response in llm.stream_chat_with_memory(
+                text, namespace, history=history
+            ):
+                if markdown is None:
+                    await sse.send(response)
+                    continue
+                for event, html in markdown.feed(response):
+                    await sse.send(html, event=event)
         done_event = "event: done\ndata: Done writing response\n\n"
         await sse.send(done_event, event="done")
         return sse
 
     @app.sse("/api/subscription/{namespace}")
-    async def suscribe_endpoint(namespace: str, sse: EventSourceResponse):
-        queue = FunctionQueue(namespace=namespace)
-        while True:
-            async for response in queue.sub():
+    async def suscribe_endpoint(
+        namespace: str, sse: EventSourceResponse, request: Request
+    ):
+        after = query_param(request, "after", "")
+        async with hub.subscribe(namespace) as subscription:
+            if after:
+                # Reconnecting clients first get what they missed from the
+                # durable result stream. The live channel is subscribed before
+                # so nothing is lost in between, a result published during the
+                # replay may be sent twice.
+                async for entry_id, fields in function_stream.replay(namespace, after):
+                    await sse.send(fields["data"], id=entry_id)
+            async for response in subscription:
                 await sse.send(response)
 
     @app.post("/api/subscription/{namespace}")
-    async def publish_endpoint(namespace: str, text: str):
+    async def publish_endpoint(namespace: str, text: str, request: Request):
+        stream = query_param(request, "stream", 0)
+        queued = query_param(request, "queued", 0)
+        if queued:
+            job = await function_stream.enqueue(
+                namespace=namespace, text=text, stream=str(stream)
+            )
+            return {"status": "queued", "id": job}
         queue = FunctionQueue(namespace=namespace)
-        await queue.pub(text)
+        await queue.pub(text, stream=bool(stream))
         return {
             "status": "success",
             "message": f"message {text} sent to queue {namespace}",
@@ -83,8 +125,53 @@ def create_app():
         return Response(body=generator(), headers={"Content-Type": "audio/mpeg"})
 
     @app.get("/api/functions")
-    async def functions(request):
-        return [i.openaischema for i in FunctionDocument.Metadata.subclasses]
+    async def functions(request: Request):
+        text = query_param(request, "text", "")
+        tools = FunctionDocument.Metadata.subclasses
+        if text:
+            tools = await tool_selector.select(text, llm.create_embedding, tools)
+        return Response(
+            text=tool_selector.schemas_json(tools), content_type="application/json"
+        )
+
+    @app.on_event("startup")
+    async def index_tools(_):
+        asyncio.create_task(tool_selector.warm(llm.create_embedding))
+
+    @app.on_event("startup")
+    async def warm_up(_):
+        asyncio.create_task(warmup.run())
+
+    @app.get("/api/ready")
+    async def ready():
+        return Response(
+            status=200 if warmup.ready else 503,
+            text=json.dumps(warmup.info),
+            content_type="application/json",
+        )
+
+    @app.on_event("startup")
+    async def consume_functions(_):
+        asyncio.create_task(function_stream.run(run_function_job))
+        asyncio.create_task(worker.run())
+        bus.start()
+
+    @app.get("/api/metrics")
+    async def metrics(request):
+        return {
+            "completions": llm.cache.stats,
+            "singleflight": flights.stats,
+            "ratelimit": scheduler_stats(),
+            "embeddings": dict(llm.batcher.stats),
+            "vectors": dict(local_index.stats),
+            "tools": dict(tool_selector.stats),
+            "tool_results": FunctionDocument.Metadata.memo_stats,
+            "pubsub": hub.info,
+            "function_jobs": function_stream.info,
+            "tasks": dict(worker.stats),
+            "models": cache_info(),
+            "invalidations": bus.info,
+        }
 
     app.use(ChatRouter()).use(LoadRouter()).use(PaymentsRouter())
 
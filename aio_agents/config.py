@@ -5,6 +5,8 @@ from dotenv import load_dotenv
 from pydantic import BaseConfig, BaseSettings
 from pydantic import Field as Data
 
+from .lazy import Lazy
+
 load_dotenv()
 
 
@@ -37,9 +39,6 @@ class AWSCredentials(BaseSettings):
         }
 
 
-credentials = AWSCredentials().dict()
-
-
 class Env(BaseSettings):
     """Environment Variables"""
 
@@ -73,4 +72,5 @@ class Env(BaseSettings):
         super().__init__(**kwargs)
 
 
-env = Env()
+# Validated on first access instead of at import time.
+env: Env = Lazy(Env)  # type: ignore
@@ -1,2 +1,5 @@
+from .cache import *
+from .loader import *
 from .models import *
+from .pagination import *
 from .schemas import *
@@ -0,0 +1,141 @@
+"""Read-through cache of `FaunaModel` lookups, invalidated by writes."""
+from collections import Counter, OrderedDict, defaultdict
+from time import monotonic
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from ..services.singleflight import flight_key, flights
+from .loader import M
+
+
+class ModelCache(Generic[M]):
+    """
+    Bounded LRU of one model's documents with per entry expiry.
+
+    Entries are keyed by ref, lookups by a unique field are aliases of the ref
+    they resolved to so invalidating the ref drops them too. Every invalidation
+    is stamped with a tick of a local clock and a fill only lands if its ref
+    was not invalidated after the fill started, so a read racing a write never
+    reinstates the old document.
+    """
+
+    def __init__(self, name: str, ttl: float, maxsize: int = 1024) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stats: Counter = Counter()
+        self._entries: "OrderedDict[str, Tuple[float, M]]" = OrderedDict()
+        self._aliases: Dict[str, str] = {}
+        self._keys: Dict[str, Set[str]] = defaultdict(set)
+        self._clock = 0
+        self._floor = 0
+        self._invalidated: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def clock(self) -> int:
+        """The current tick, pass it to `set` for a fill starting now."""
+        return self._clock
+
+    def get(self, key: str) -> Optional[M]:
+        ref = self._aliases.get(key, key)
+        entry = self._entries.get(ref)
+        if entry is None:
+            return None
+        expires, model = entry
+        if expires < monotonic():
+            self.stats["expired"] += 1
+            self._drop(ref)
+            return None
+        self._entries.move_to_end(ref)
+        return model.copy(deep=True)
+
+    def set(self, key: str, model: M, started: int) -> bool:
+        """Stores `model` unless its ref was invalidated after tick `started`."""
+        ref = model.ref
+        if (
+            not isinstance(ref, str)
+            or started < self._floor
+            or self._invalidated.get(ref, 0) > started
+        ):
+            self.stats["stale_fills"] += 1
+            return False
+        self._entries[ref] = (monotonic() + self.ttl, model.copy(deep=True))
+        self._entries.move_to_end(ref)
+        if key != ref:
+            self._aliases[key] = ref
+            self._keys[ref].add(key)
+        while len(self._entries) > self.maxsize:
+            self.stats["evictions"] += 1
+            self._drop(next(iter(self._entries)))
+        return True
+
+    def invalidate(self, ref: str) -> None:
+        """Drops `ref` and its aliases and fences off fills already in flight."""
+        self._clock += 1
+        self._invalidated[ref] = self._clock
+        if len(self._invalidated) > 4 * self.maxsize:
+            # Forget the stamps, fills from before now are all refused instead.
+            self._invalidated.clear()
+            self._floor = self._clock
+        if ref in self._entries:
+            self.stats["invalidations"] += 1
+        self._drop(ref)
+
+    def clear(self) -> None:
+        self._clock += 1
+        self._floor = self._clock
+        self._invalidated.clear()
+        self._entries.clear()
+        self._aliases.clear()
+        self._keys.clear()
+
+    async def fetch(
+        self, key: str, load: Callable[[], Awaitable[Optional[M]]]
+    ) -> Optional[M]:
+        """
+        The cached document for `key`, else `load()` once for all concurrent
+        callers. Misses (None) are not cached.
+        """
+        model = self.get(key)
+        if model is not None:
+            self.stats["hits"] += 1
+            return model
+        self.stats["misses"] += 1
+        started = self.clock
+        # The tick is part of the key so nobody joins a load older than a write.
+        model = await flights.do(flight_key(f"model_{self.name}", key, started), load)
+        if model is None:
+            return None
+        self.set(key, model, started)
+        return model.copy(deep=True)
+
+    @property
+    def info(self) -> Dict[str, object]:
+        return {"size": len(self), "ttl": self.ttl, **self.stats}
+
+    def _drop(self, ref: str) -> None:
+        self._entries.pop(ref, None)
+        for key in self._keys.pop(ref, ()):
+            self._aliases.pop(key, None)
+
+
+caches: Dict[str, ModelCache] = {}
+
+# Called with (model name, ref) for every write, e.g. to tell other processes.
+write_listeners: List[Callable[[str, str], None]] = []
+
+
+def cache_info() -> Dict[str, Dict[str, object]]:
+    """Per model cache metrics."""
+    return {name: cache.info for name, cache in caches.items()}
@@ -0,0 +1,106 @@
+"""Request-scoped batching of `FaunaModel` reads."""
+import asyncio
+from contextvars import ContextVar
+from typing import Any, Dict, Generic, List, Optional, Sequence, Type, TypeVar
+
+from aiofauna import FaunaModel, q, setup_logging
+
+M = TypeVar("M", bound=FaunaModel)
+
+logger = setup_logging(__name__)
+
+MAX_BATCH = 500
+
+
+def from_document(model: Type[M], document: Dict[str, Any]) -> M:
+    """Builds a model from a raw Fauna document, like `FaunaModel.get` does."""
+    return model(
+        **{
+            **document["data"],
+            "ref": document["ref"]["@ref"]["id"],
+            "ts": document["ts"] / 1000,
+        }
+    )
+
+
+async def fetch_refs(model: Type[M], refs: Sequence[str]) -> List[Optional[M]]:
+    """Gets many documents of `model` in one query, None for missing refs."""
+    collection = q.collection(model.__name__.lower())
+    response = await model.q()(
+        q.map_(
+            q.lambda_(
+                "ref", q.if_(q.exists(q.var("ref")), q.get(q.var("ref")), None)
+            ),
+            [q.ref(collection, ref) for ref in refs],
+        )
+    )
+    if not isinstance(response, list):
+        raise ValueError(f"Batched get of {model.__name__} failed: {response}")
+    return [None if i is None else from_document(model, i) for i in response]
+
+
+class DataLoader(Generic[M]):
+    """
+    Coalesces `load` calls made during the same event loop tick into a single
+    batched query, each ref is requested once per loader. Use `for_request`
+    to share a loader across everything a request awaits.
+    """
+
+    def __init__(self, model: Type[M], max_batch: int = MAX_BATCH) -> None:
+        self.model = model
+        self.max_batch = max_batch
+        self.queries = 0
+        self._futures: Dict[str, "asyncio.Future[Optional[M]]"] = {}
+        self._queue: List[str] = []
+
+    def load(self, ref: str) -> "asyncio.Future[Optional[M]]":
+        if ref not in self._futures:
+            loop = asyncio.get_running_loop()
+            self._futures[ref] = loop.create_future()
+            if not self._queue:
+                # Two hops so tasks created alongside this call get to queue
+                # their refs before the batch is sent.
+                loop.call_soon(loop.call_soon, self._dispatch)
+            self._queue.append(ref)
+        return self._futures[ref]
+
+    async def load_many(self, refs: Sequence[str]) -> List[Optional[M]]:
+        return await asyncio.gather(*[self.load(ref) for ref in refs])
+
+    def _dispatch(self) -> None:
+        refs, self._queue = self._queue, []
+        for start in range(0, len(refs), self.max_batch):
+            asyncio.create_task(self._fetch(refs[start : start + self.max_batch]))
+
+    async def _fetch(self, refs: List[str]) -> None:
+        self.queries += 1
+        # `DataModel.get_many` also serves and fills the model's cache.
+        get_many = getattr(self.model, "get_many", None)
+        try:
+            if get_many is None:
+                models = await fetch_refs(self.model, refs)
+            else:
+                models = await get_many(refs)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.error("Batch of %s %s failed: %s", len(refs), self.model, exc)
+            for ref in refs:
+                self._futures.pop(ref).set_exception(exc)
+            return
+        for ref, model in zip(refs, models):
+            self._futures[ref].set_result(model)
+
+    @classmethod
+    def for_request(cls, model: Type[M]) -> "DataLoader[M]":
+        """The loader of `model` for the current request task."""
+        loaders = _loaders.get(None)
+        if loaders is None:
+            loaders = {}
+            _loaders.set(loaders)
+        if model not in loaders:
+            loaders[model] = cls(model)
+        return loaders[model]
+
+
+_loaders: ContextVar[Optional[Dict[type, DataLoader]]] = ContextVar(
+    "loaders", default=None
+)
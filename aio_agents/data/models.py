@@ -1,16 +1,267 @@
+import asyncio
+from collections import defaultdict
 from datetime import datetime
-from typing import List, Optional
+from typing import (
+    Any,
+    ClassVar,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Type,
+    TypeVar,
+    Union,
+)
 
-from aiofauna import FaunaModel, handle_errors
+from aiofauna import FaunaModel, handle_errors, q
+from aiofauna.faunadb.query import Expr
 from pydantic import Field
 
-from ..services import *
-from .schemas import WordCount
+from ..services.openai import LLMStack
+from ..services.singleflight import flight_key, flights
+from ..services.sketch import CountMinSketch, TermSummary
+from .cache import ModelCache, caches, write_listeners
+from .loader import MAX_BATCH, fetch_refs, from_document
+from .pagination import Page, decode_cursor, encode_cursor, iterate_pages
+from .schemas import HeavyHitter, WordCount
 
 llm = LLMStack()
 
+D = TypeVar("D", bound="DataModel")
 
-class User(FaunaModel):
+
+class DataModel(FaunaModel):
+    """
+    `FaunaModel` with bulk reads and writes that cost one query each and
+    paginated, projected listings. Models that set `cache_ttl` serve `get`,
+    `get_many` and `find_unique` from a `ModelCache` that their own writes
+    invalidate.
+    """
+
+    cache_ttl: ClassVar[Optional[float]] = None
+    cache_size: ClassVar[int] = 1024
+
+    @classmethod
+    def model_cache(cls) -> Optional[ModelCache]:
+        if cls.cache_ttl is None:
+            return None
+        name = cls.__name__.lower()
+        if name not in caches:
+            caches[name] = ModelCache(name, cls.cache_ttl, cls.cache_size)
+        return caches[name]
+
+    @classmethod
+    def invalidate(cls, *refs: str) -> None:
+        """Evicts documents this process just wrote and tells `write_listeners`."""
+        cache = cls.model_cache()
+        if cache is None:
+            return
+        for ref in refs:
+            cache.invalidate(ref)
+            for listener in write_listeners:
+                listener(cache.name, ref)
+
+    @classmethod
+    async def get(cls: Type[D], ref: str) -> D:
+        cache = cls.model_cache()
+        load = super().get
+        if cache is None:
+            return await load(ref)
+        return await cache.fetch(ref, lambda: load(ref))  # type: ignore
+
+    @classmethod
+    async def find_unique(cls: Type[D], **kwargs: Any) -> Optional[D]:
+        cache = cls.model_cache()
+        load = super().find_unique
+        if cache is None or len(kwargs) != 1:
+            return await load(**kwargs)
+        field, value = list(kwargs.items())[0]
+        return await cache.fetch(f"{field}={value}", lambda: load(**kwargs))
+
+    @classmethod
+    async def update(cls: Type[D], ref: str, **kwargs: Any) -> D:
+        try:
+            return await super().update(ref, **kwargs)
+        finally:
+            cls.invalidate(ref)
+
+    @classmethod
+    async def delete(cls, ref: str) -> bool:
+        try:
+            return await super().delete(ref)
+        finally:
+            cls.invalidate(ref)
+
+    def write_expr(self) -> Expr:
+        """The FQL `save` runs: update by ref, else return the document that
+        holds any unique value already or create a new one."""
+        name = self.__class__.__name__.lower()
+        collection = q.collection(name)
+        if isinstance(self.ref, str) and len(self.ref) == 18:
+            return q.update(q.ref(collection, self.ref), {"data": self.dict()})
+        expr = q.create(collection, {"data": self.dict()})
+        for field in self.__fields__.values():
+            if field.field_info.extra.get("unique"):
+                match = q.match(
+                    q.index(f"{name}_{field.name}_unique"),
+                    self.__dict__[field.name],
+                )
+                expr = q.if_(q.exists(match), q.get(match), expr)
+        return expr
+
+    @classmethod
+    async def save_many(cls, instances: Sequence["DataModel"]) -> List[Any]:
+        """
+        Saves many documents, of any `DataModel`, each batch of `MAX_BATCH` in
+        one transaction. Returns them saved, in order.
+        """
+        saved: List[Any] = []
+        for start in range(0, len(instances), MAX_BATCH):
+            batch = instances[start : start + MAX_BATCH]
+            try:
+                response = await cls.q()(
+                    q.let(
+                        {"saved": [instance.write_expr() for instance in batch]},
+                        q.var("saved"),
+                    )
+                )
+            finally:
+                for instance in batch:
+                    if isinstance(instance.ref, str) and len(instance.ref) == 18:
+                        instance.invalidate(instance.ref)
+            if not isinstance(response, list):
+                raise ValueError(f"Bulk save of {cls.__name__} failed: {response}")
+            saved += [
+                from_document(instance.__class__, document)
+                for instance, document in zip(batch, response)
+            ]
+        return saved
+
+    @classmethod
+    async def get_many(cls: Type[D], refs: Sequence[str]) -> List[Optional[D]]:
+        """
+        Gets many documents by ref, None for missing ones. Cached documents are
+        served from the cache, the rest cost one query per `MAX_BATCH` refs.
+        """
+        cache = cls.model_cache()
+        found: Dict[str, D] = {}
+        if cache is not None:
+            for ref in set(refs):
+                model = cache.get(ref)
+                if model is not None:
+                    found[ref] = model
+            cache.stats["hits"] += len(found)
+        missing = [ref for ref in dict.fromkeys(refs) if ref not in found]
+        started = 0
+        if cache is not None:
+            cache.stats["misses"] += len(missing)
+            started = cache.clock
+        for start in range(0, len(missing), MAX_BATCH):
+            batch = missing[start : start + MAX_BATCH]
+            for ref, model in zip(batch, await fetch_refs(cls, batch)):
+                if model is None:
+                    continue
+                found[ref] = model
+                if cache is not None:
+                    cache.set(ref, model, started)
+        return [found.get(ref) for ref in refs]
+
+    @classmethod
+    async def find_many(
+        cls: Type[D],
+        limit: int = 50,
+        fields: Optional[Sequence[str]] = None,
+        **kwargs: Any,
+    ) -> List[Union[D, Dict[str, Any]]]:
+        """
+        Documents matching the `<model>_<field>` index in a single query. With
+        `fields` only those (plus `ref` and `ts`) are read and plain dicts are
+        returned instead of models.
+        """
+        try:
+            return (await cls.find_page(limit=limit, fields=fields, **kwargs)).data
+        except (KeyError, TypeError, ValueError) as exc:
+            cls.logger.error(exc.__class__.__name__)
+            cls.logger.error(exc)
+            return []
+
+    @classmethod
+    async def find_page(
+        cls,
+        limit: int = 50,
+        after: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None,
+        **kwargs: Any,
+    ) -> Page:
+        """`find_many` one page at a time, `after` is the previous page's cursor."""
+        field, value = list(kwargs.items())[0]
+        return await cls.paginate(
+            f"{cls.__name__.lower()}_{field}",
+            value,
+            limit=limit,
+            after=after,
+            fields=fields,
+        )
+
+    @classmethod
+    async def paginate(
+        cls,
+        index: str,
+        *terms: Any,
+        limit: int = 50,
+        after: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None,
+        values: Sequence[str] = ("ref",),
+        reverse: bool = False,
+    ) -> Page:
+        """
+        One page of the documents of `index`, `after` is the cursor of the
+        previous page. `values` names what the index returns, the ref last,
+        `reverse` walks the index from its end. Raises ValueError on a bad
+        cursor or a failed query.
+        """
+        match = q.match(q.index(index), *terms)
+        document = q.get(q.var(values[-1]))
+        if fields:
+            document = q.let(
+                {"doc": document},
+                {
+                    "ref": q.select(["ref"], q.var("doc")),
+                    "ts": q.select(["ts"], q.var("doc")),
+                    "data": {
+                        name: q.select(["data", name], q.var("doc"), None)
+                        for name in fields
+                    },
+                },
+            )
+        response = await cls.q()(
+            q.map_(
+                q.lambda_(list(values) if len(values) > 1 else values[0], document),
+                q.paginate(
+                    q.reverse(match) if reverse else match,
+                    size=limit,
+                    after=decode_cursor(cls.__name__.lower(), after),
+                ),
+            )
+        )
+        if not isinstance(response, dict) or "data" not in response:
+            raise ValueError(f"Listing {index} failed: {response}")
+        if fields:
+            data: List[Any] = [
+                {**i["data"], "ref": i["ref"]["@ref"]["id"], "ts": i["ts"] / 1000}
+                for i in response["data"]
+            ]
+        else:
+            data = [from_document(cls, i) for i in response["data"]]
+        return Page(data=data, after=encode_cursor(response.get("after")))
+
+
+# The base has no collection of its own.
+FaunaModel.Metadata.subclasses.remove(DataModel)
+
+
+class User(DataModel):
     """
     Auth0 User, Github User or Cognito User
     """
@@ -26,29 +277,140 @@ class User(FaunaModel):
     sub: str = Field(..., unique=True)
     updated_at: Optional[str] = Field(default=None)
 
+    cache_ttl = 300
 
-class ChatMessage(FaunaModel):
+
+class ChatMessage(DataModel):
     namespace: str = Field(..., description="The namespace id.", index=True)
     owner: str = Field(..., description="The owner of the message.")
     content: str = Field(..., description="The content of the message.")
 
+    @classmethod
+    async def provision(cls) -> bool:
+        """Also creates `chatmessage_log`, a namespace's messages oldest first."""
+        if not await super().provision():
+            return False
+        _q = cls.q()
+        if not await _q(q.exists(q.index("chatmessage_log"))):
+            await _q(
+                q.create_index(
+                    {
+                        "name": "chatmessage_log",
+                        "source": q.collection("chatmessage"),
+                        "terms": [{"field": ["data", "namespace"]}],
+                        "values": [{"field": ["ts"]}, {"field": ["ref"]}],
+                    }
+                )
+            )
+            cls.logger.info("Created index chatmessage_log")
+        return True
+
+    @classmethod
+    async def log(
+        cls,
+        namespace: str,
+        limit: int = 50,
+        after: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> Page:
+        """A page of the append-only message log of `namespace`."""
+        return await cls.paginate(
+            "chatmessage_log",
+            namespace,
+            limit=limit,
+            after=after,
+            fields=fields,
+            values=("ts", "ref"),
+        )
+
+    @classmethod
+    async def history(cls, namespace: str) -> List["ChatMessage"]:
+        """Every message of `namespace` oldest first, read a batch at a time."""
+        messages: List[ChatMessage] = []
+        async for page in iterate_pages(
+            lambda after: cls.log(namespace, limit=MAX_BATCH, after=after)
+        ):
+            messages += page.data
+        return messages
+
+    @classmethod
+    async def latest(cls, namespace: str, limit: int = 50) -> List["ChatMessage"]:
+        """The last `limit` messages of `namespace`, oldest first."""
+        page = await cls.paginate(
+            "chatmessage_log",
+            namespace,
+            limit=limit,
+            values=("ts", "ref"),
+            reverse=True,
+        )
+        return page.data[::-1]
+
 
-class Namespace(FaunaModel):
+class Namespace(DataModel):
+    # Legacy list of message refs, new messages only bump `message_count`.
     messages: List[str] = Field(default_factory=list)
+    message_count: int = Field(default=0)
     title: str = Field(default="[New Namespace]", index=True)
     user: str = Field(..., index=True)
     participants: List[str] = Field(default_factory=list)
 
+    cache_ttl = 60
+
+    @property
+    def has_messages(self) -> bool:
+        return self.message_count > 0 or len(self.messages) > 0
+
+    @classmethod
+    async def count_message(cls, ref: str) -> int:
+        """Atomically bumps `message_count`, the document is never rewritten."""
+        namespace = q.ref(q.collection("namespace"), ref)
+        count = q.add(
+            q.select(["data", "message_count"], q.get(namespace), 0),
+            1,
+        )
+        response = await cls.q()(
+            q.select(
+                ["data", "message_count"],
+                q.update(namespace, {"data": {"message_count": count}}),
+            )
+        )
+        cls.invalidate(ref)
+        if not isinstance(response, int):
+            raise ValueError(f"Counting a message of {ref} failed: {response}")
+        return response
+
     @handle_errors
     async def set_title(self, text: str):
-        response = await llm.chat(
-            text=text,
-            context=f"You are a namespace titles generator, you will generate this namespace name based on the user first prompt. It must be no longer than 1 sentence of 7 words. FIRST PROMPT: {text}",
+        async def generate():
+            response = await llm.chat(
+                text=text,
+                context=f"You are a namespace titles generator, you will generate this namespace name based on the user first prompt. It must be no longer than 1 sentence of 7 words. FIRST PROMPT: {text}",
+                temperature=0,
+            )
+            return await self.update(self.ref, title=response)  # type:ignore
+
+        return await flights.do(flight_key("title", self.ref), generate)
+
+
+class ConversationSummary(DataModel):
+    """Rolling summary of the messages of a namespace up to `through`."""
+
+    namespace: str = Field(..., description="The namespace id.", unique=True)
+    summary: str = Field(default="", description="The summary text.")
+    through: str = Field(
+        default="", description="`ts` of the newest summarized message."
+    )
+
+    @classmethod
+    async def store(cls, namespace: str, summary: str, through: str) -> None:
+        stored = await cls.find_unique(namespace=namespace) or cls(
+            namespace=namespace
         )
-        return await self.update(self.ref, title=response)  # type:ignore
+        stored.summary, stored.through = summary, through
+        await stored.save()
 
 
-class FileData(FaunaModel):
+class FileData(DataModel):
     namespace: str = Field(..., description="The namespace id.", index=True)
     user: str = Field(..., description="The owner of the file.", index=True)
     name: str = Field(..., description="The name of the file.")
@@ -64,7 +426,7 @@ class FileData(FaunaModel):
     url: str = Field(..., description="The url of the file.", unique=True)
 
 
-class Track(FaunaModel):
+class Track(DataModel):
     namespace: str = Field(..., description="The namespace id.", index=True)
     user: str = Field(..., description="The owner of the file.", index=True)
     upload: FileData = Field(..., description="The file data of the track.")
@@ -74,7 +436,7 @@ class Track(FaunaModel):
     description: str = Field(..., description="The description of the track.")
 
 
-class Image(FaunaModel):
+class Image(DataModel):
     namespace: str = Field(..., description="The namespace id.", index=True)
     user: str = Field(..., description="The owner of the file.", index=True)
     upload: FileData = Field(..., description="The file data of the image.")
@@ -82,7 +444,7 @@ class Image(FaunaModel):
     description: str = Field(..., description="The description of the image.")
 
 
-class Video(FaunaModel):
+class Video(DataModel):
     namespace: str = Field(..., description="The namespace id.", index=True)
     user: str = Field(..., description="The owner of the file.", index=True)
     upload: FileData = Field(..., description="The file data of the video.")
@@ -91,13 +453,13 @@ class Video(FaunaModel):
     description: str = Field(..., description="The description of the video.")
 
 
-class DataVisualization(FaunaModel):
+class DataVisualization(DataModel):
     labels: List[str] = Field(default_factory=list)
     datasets: list = Field(default_factory=list)
     namespace: str = Field(..., description="The namespace id.", index=True)
 
 
-class BlogPost(FaunaModel):
+class BlogPost(DataModel):
     namespace: str = Field(..., description="The namespace id.", index=True)
     user: str = Field(..., description="The owner of the file.", index=True)
     title: str = Field(..., description="The title of the blog post.", index=True)
@@ -115,7 +477,7 @@ class BlogPost(FaunaModel):
     tags: Optional[List[str]] = Field(default=None, index=True)
 
 
-class BookOrDocument(FaunaModel):
+class BookOrDocument(DataModel):
     namespace: str = Field(..., description="The namespace id.", index=True)
     title: str = Field(..., description="The title of document.", index=True)
     wordcloud: List[WordCount] = Field(
@@ -132,7 +494,47 @@ class BookOrDocument(FaunaModel):
     )
 
 
-class DatabaseKey(FaunaModel):
+class NamespaceTerms(DataModel):
+    """
+    Term frequencies of every document loaded into a namespace, kept as a
+    count-min sketch plus the heaviest terms so it can be updated per document
+    and read without touching the documents again.
+    """
+
+    namespace: str = Field(..., description="The namespace id.", unique=True)
+    total: int = Field(default=0, description="Number of counted tokens.")
+    sketch: str = Field(default="", description="Compressed count-min table.")
+    heavy: List[HeavyHitter] = Field(default_factory=list)
+
+    def summary(self) -> TermSummary:
+        summary = TermSummary(total=self.total)
+        if self.sketch:
+            summary.sketch = CountMinSketch.loads(self.sketch)
+        summary.heavy.counters = {i.word: (i.count, i.error) for i in self.heavy}
+        return summary
+
+    @classmethod
+    async def record(cls, namespace: str, counts: Mapping[str, int]):
+        """Merges the term counts of a new document into the namespace."""
+        async with _terms_locks[namespace]:
+            terms = await cls.find_unique(namespace=namespace) or cls(
+                namespace=namespace
+            )
+            summary = terms.summary()
+            summary.update(counts)
+            terms.total = summary.total
+            terms.sketch = summary.sketch.dumps()
+            terms.heavy = [
+                HeavyHitter(word=word, count=count, error=error)
+                for word, count, error in summary.heavy.top(summary.heavy.capacity)
+            ]
+            return await terms.save()
+
+
+_terms_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+
+class DatabaseKey(DataModel):
     """
 
     Fauna Database Key
@@ -146,3 +548,5 @@ class DatabaseKey(FaunaModel):
     secret: str = Field(...)
     hashed_secret: str = Field(...)
     role: str = Field(...)
+
+    cache_ttl = 300
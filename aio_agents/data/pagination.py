@@ -0,0 +1,55 @@
+"""Opaque cursors over Fauna pages."""
+import base64
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional
+
+from aiofauna import q
+from pydantic import BaseModel, Field  # pylint: disable=no-name-in-module
+
+
+class Page(BaseModel):
+    """A slice of a listing, pass `after` back to get the next one."""
+
+    data: List[Any] = Field(default_factory=list)
+    after: Optional[str] = Field(default=None)
+
+
+def encode_cursor(after: Optional[List[Any]]) -> Optional[str]:
+    """Turns the `after` of a Fauna page into a URL safe token."""
+    if not after:
+        return None
+    plain = [
+        {"ref": value["@ref"]["id"]}
+        if isinstance(value, dict) and "@ref" in value
+        else value
+        for value in after
+    ]
+    return base64.urlsafe_b64encode(json.dumps(plain).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(collection: str, cursor: Optional[str]) -> Optional[List[Any]]:
+    """The FQL `after` of a token made by `encode_cursor`."""
+    if not cursor:
+        return None
+    try:
+        plain = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except ValueError as exc:
+        raise ValueError(f"Invalid cursor {cursor}") from exc
+    return [
+        q.ref(q.collection(collection), value["ref"])
+        if isinstance(value, dict)
+        else value
+        for value in plain
+    ]
+
+
+async def iterate_pages(
+    fetch: Callable[[Optional[str]], Awaitable[Page]], after: Optional[str] = None
+) -> AsyncIterator[Page]:
+    """Pages of `fetch(after)` until the last one, fetched as they are consumed."""
+    while True:
+        page = await fetch(after)
+        yield page
+        if page.after is None:
+            return
+        after = page.after
@@ -7,6 +7,12 @@ class WordCount(BaseModel):
     count: int = Field(...)
 
 
+class HeavyHitter(BaseModel):
+    word: str = Field(...)
+    count: int = Field(...)
+    error: int = Field(default=0)
+
+
 class DNSMeta(Document):
     auto_added: bool
     managed_by_apps: bool
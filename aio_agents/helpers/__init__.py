@@ -1,6 +1,7 @@
 from .audio import *
 from .blocks import *
 from .chains import *
+from .history import *
 from .loaders import *
 from .markdown import *
 from .prompts import *
@@ -1,30 +1,64 @@
+"""Audio embeddings: spectral band energies of the decoded PCM signal."""
 import io
-from typing import List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
 
 import numpy as np
-from pydub import AudioSegment
-from scipy.io import wavfile
 
 Vector = List[float]
 
+DIMENSIONS = 1536
 
-def mp3_to_vect(binary_audio: bytes) -> Tuple[Vector, int]:
+
+def decode_audio(binary_audio: bytes) -> Tuple[np.ndarray, float]:
+    """Decodes an MP3 once into mono float32 samples in [-1, 1] and its duration."""
+    from pydub import AudioSegment  # pylint: disable=import-outside-toplevel
+
+    audio = AudioSegment.from_file(io.BytesIO(binary_audio), format="mp3")
+    if audio.channels > 1:
+        audio = audio.set_channels(1)
+    samples = np.asarray(audio.get_array_of_samples(), dtype=np.float32)
+    samples /= float(1 << (8 * audio.sample_width - 1))
+    return samples, audio.duration_seconds
+
+
+def band_energies(samples: np.ndarray, bands: int = DIMENSIONS) -> np.ndarray:
+    """
+    Mean power of `bands` equal-width frequency bands of the real FFT, log
+    compressed and L2 normalized, so every bin contributes to the embedding.
+    """
+    spectrum = np.abs(np.fft.rfft(samples)) ** 2
+    if len(spectrum) < bands:
+        spectrum = np.pad(spectrum, (0, bands - len(spectrum)))
+    edges = np.linspace(0, len(spectrum), bands + 1).astype(np.int64)
+    energies = np.add.reduceat(spectrum, edges[:-1]) / np.diff(edges)
+    embedding = np.log1p(energies).astype(np.float32)
+    norm = np.linalg.norm(embedding)
+    return embedding / norm if norm else embedding
+
+
+def embed_audio(binary_audio: bytes) -> Tuple[np.ndarray, float]:
+    samples, duration = decode_audio(binary_audio)
+    return band_energies(samples), duration
+
+
+def mp3_to_vect(binary_audio: bytes) -> Tuple[Vector, float]:
     """
     Converts the given audio to a vector
     """
-    audio = AudioSegment.from_mp3(io.BytesIO(binary_audio))
-    duration = audio.duration_seconds
-    if audio.channels == 2:
-        audio = audio.set_channels(1)
-    wav_data = io.BytesIO(binary_audio)
-    audio.export(wav_data, format="wav")
-    wav_data.seek(0)
-    _, audio_sample = wavfile.read(wav_data)
-    fft_sample = np.fft.fft(audio_sample)
-    combined_fft = np.concatenate((np.real(fft_sample), np.imag(fft_sample)))
-    step_size = len(combined_fft) // 1536
-    subsampled_embedding = combined_fft[::step_size][:1536]
-    normalized_embedding = (
-        subsampled_embedding / np.linalg.norm(subsampled_embedding)
-    ).tolist()
-    return normalized_embedding, duration
+    embedding, duration = embed_audio(binary_audio)
+    return embedding.tolist(), duration
+
+
+def embed_many(
+    files: Sequence[bytes], processes: Optional[int] = None
+) -> Tuple[np.ndarray, List[float]]:
+    """
+    Embeds many MP3 files, decoding and FFTs run in a process pool. Returns a
+    `(len(files), DIMENSIONS)` float32 matrix and the durations.
+    """
+    if not files:
+        return np.empty((0, DIMENSIONS), dtype=np.float32), []
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        results = list(pool.map(embed_audio, files))
+    return np.stack([i[0] for i in results]), [i[1] for i in results]
@@ -1,6 +1,6 @@
-from typing import TypeVar
+from typing import Optional, TypeVar
 
-from aiofauna import Document, FaunaModel
+from aiofauna import Document
 from jinja2 import Template
 from pydantic import Field
 from typing_extensions import ParamSpec
@@ -11,13 +11,13 @@ T = TypeVar("T")
 P = ParamSpec("P")
 
 
-class Block(FaunaModel):
+class Block(DataModel):
     id: str = Field(..., description="The id of the tiptap block", unique=True)
     content: str = Field(..., description="The content of the tiptap block")
     type: str = Field(..., description="The type of the tiptap block", index=True)
 
 
-class TipTap(FaunaModel):
+class TipTap(DataModel):
     namespace: str = Field(
         ..., description="The namespace of the tiptap block", index=True
     )
@@ -27,9 +27,11 @@ class TipTap(FaunaModel):
     block: Block = Field(..., description="The tiptap block")
 
     @classmethod
-    async def fetch(cls, namespace: str):
-        """Fetches all the blocks for a given namespace."""
-        return await cls.find_many(namespace=namespace)
+    async def fetch(
+        cls, namespace: str, limit: int = 50, after: Optional[str] = None
+    ) -> Page:
+        """Fetches a page of the blocks for a given namespace."""
+        return await cls.find_page(limit=limit, after=after, namespace=namespace)
 
 
 class TipTapHtml(Document):
@@ -40,4 +42,5 @@ class TipTapHtml(Document):
         """Renders the tiptap block."""
         template = Template(self.template)
         user = await User.get(self.tiptap.user)
-        return template.render(tiptap=await self.tiptap.fetch(), user=user)
+        blocks = await self.tiptap.fetch(self.tiptap.namespace, limit=MAX_BATCH)
+        return template.render(tiptap=blocks.data, user=user)
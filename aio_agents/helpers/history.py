@@ -0,0 +1,178 @@
+"""Rolling, token-bounded conversation history per namespace."""
+import asyncio
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+from aiofauna import setup_logging
+
+from ..data import ChatMessage, ConversationSummary
+from ..services import LLMStack, count_tokens
+from ..tasks.invalidation import bus
+
+logger = setup_logging(__name__)
+
+SUMMARY_PROMPT = "You maintain a running summary of a conversation. Merge the new turns into the current summary, keep names, facts, decisions and open questions, drop chit-chat. Answer with the updated summary only, at most 200 words."
+
+
+@dataclass
+class ConversationWindow:
+    """
+    The last `max_turns` turns of a namespace verbatim, within `max_tokens`,
+    plus a rolling summary of everything older.
+
+    Turns pushed out of the window are folded into the summary by a background
+    task, so `messages` never waits on the LLM and costs the same no matter how
+    long the conversation is. The summary is stored with the `ts` of the last
+    message it covers, `through`, so hydrating a window does not redo it.
+    """
+
+    namespace: str
+    llm: LLMStack = field(repr=False)
+    max_turns: int = field(default=8)
+    max_tokens: int = field(default=1500)
+    summary: str = field(default="")
+    through: str = field(default="")
+    turns: Deque[Dict[str, str]] = field(default_factory=deque)
+    _tokens: Deque[int] = field(default_factory=deque, repr=False)
+    _stamps: Deque[str] = field(default_factory=deque, repr=False)
+    _total: int = field(default=0, repr=False)
+    _overflow: List[Tuple[Dict[str, str], str]] = field(
+        default_factory=list, repr=False
+    )
+    _task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    def append(self, role: str, content: str, ts: str = "") -> None:
+        tokens = count_tokens(content) + 4
+        self.turns.append({"role": role, "content": content})
+        self._tokens.append(tokens)
+        self._stamps.append(ts)
+        self._total += tokens
+        while len(self.turns) > 1 and (
+            len(self.turns) > self.max_turns or self._total > self.max_tokens
+        ):
+            self._overflow.append((self.turns.popleft(), self._stamps.popleft()))
+            self._total -= self._tokens.popleft()
+        if self._overflow and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._summarize())
+
+    def messages(self, prompt: Optional[str] = None) -> List[Dict[str, str]]:
+        """
+        History messages ready to be prepended to a chat request. A last user
+        turn equal to `prompt` is left out, the request sends it itself.
+        """
+        history = list(self.turns)
+        if history and history[-1] == {"role": "user", "content": prompt}:
+            history.pop()
+        if self.summary:
+            history.insert(
+                0,
+                {
+                    "role": "system",
+                    "content": f"Summary of the earlier conversation: {self.summary}",
+                },
+            )
+        return history
+
+    async def _summarize(self) -> None:
+        while self._overflow:
+            batch, self._overflow = self._overflow, []
+            transcript = "\n".join(f"{t['role']}: {t['content']}" for t, _ in batch)
+            try:
+                self.summary = await self.llm.chat(
+                    text=f"CURRENT SUMMARY: {self.summary or '(empty)'}\n\nNEW TURNS:\n{transcript}",
+                    context=SUMMARY_PROMPT,
+                    temperature=0,
+                )
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.error("Summary of %s failed: %s", self.namespace, exc)
+                self._overflow = batch + self._overflow
+                return
+            self.through = max([ts for _, ts in batch] + [self.through], key=stamp)
+            try:
+                await ConversationSummary.store(
+                    self.namespace, self.summary, self.through
+                )
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.error("Storing summary of %s failed: %s", self.namespace, exc)
+
+
+@dataclass
+class ConversationManager:
+    """
+    Bounded LRU of conversation windows, a miss is hydrated from the tail of
+    the `ChatMessage` log.
+    """
+
+    maxsize: int = field(default=1024)
+    hydrate: int = field(default=50)
+    llm: LLMStack = field(default_factory=LLMStack, repr=False)
+    _windows: "OrderedDict[str, ConversationWindow]" = field(
+        default_factory=OrderedDict, repr=False
+    )
+
+    async def get(self, namespace: str) -> ConversationWindow:
+        window = self._windows.get(namespace)
+        if window is None:
+            window = await self._hydrate(namespace)
+            window = self._windows.setdefault(namespace, window)
+        self._windows.move_to_end(namespace)
+        while len(self._windows) > self.maxsize:
+            self._windows.popitem(last=False)
+        return window
+
+    async def record(self, message: ChatMessage) -> None:
+        """
+        Appends a saved message, a cold window picks it up when hydrated.
+        Other workers drop their window of the namespace and hydrate it again.
+        """
+        bus.publish("conversations", message.namespace)
+        if message.namespace in self._windows:
+            self._windows[message.namespace].append(
+                role(message), message.content, message.ts
+            )
+        else:
+            await self.get(message.namespace)
+
+    def evict(self, namespace: str) -> None:
+        self._windows.pop(namespace, None)
+
+    def clear(self) -> None:
+        self._windows.clear()
+
+    async def _hydrate(self, namespace: str) -> ConversationWindow:
+        """
+        The stored summary plus the latest `hydrate` messages it does not cover
+        yet: the newest fill the window and older ones overflow into the summary.
+        """
+        window = ConversationWindow(namespace=namespace, llm=self.llm)
+        try:
+            stored, messages = await asyncio.gather(
+                ConversationSummary.find_unique(namespace=namespace),
+                ChatMessage.latest(namespace, self.hydrate),
+            )
+        except ValueError as exc:
+            logger.error("Hydrating %s failed: %s", namespace, exc)
+            return window
+        if stored is not None:
+            window.summary, window.through = stored.summary, stored.through
+        for message in messages:
+            if stamp(message.ts) > stamp(window.through):
+                window.append(role(message), message.content, message.ts)
+        return window
+
+
+def role(message: ChatMessage) -> str:
+    return "assistant" if message.owner == "agent" else "user"
+
+
+def stamp(ts: str) -> float:
+    """A message `ts` as a number, 0 when it is unknown."""
+    try:
+        return float(ts)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+conversations = ConversationManager()
+bus.register("conversations", conversations.evict, conversations.clear)
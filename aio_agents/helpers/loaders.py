@@ -4,12 +4,11 @@ from typing import AsyncGenerator, List, Tuple
 
 from aiofauna import FileField, handle_errors, setup_logging
 from aiohttp import ClientSession
-from boto3 import client
-from bs4 import BeautifulSoup  # pylint: disable=import-error
-from pypdf import PdfReader  # pylint: disable=import-error
+
+from ..lazy import aws_client
 
 logger = setup_logging(__name__)
-s3 = client("s3", region_name="us-east-1")
+s3 = aws_client("s3", region_name="us-east-1")
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
@@ -45,6 +44,8 @@ BAD_EXT = (
 
 @handle_errors
 async def sitemap(url: str, session: ClientSession) -> List[str]:
+    from bs4 import BeautifulSoup  # pylint: disable=import-outside-toplevel
+
     urls = []
     if not url.endswith("xml"):
         url = f"{url.rstrip('/')}/sitemap.xml"
@@ -63,6 +64,8 @@ async def sitemap(url: str, session: ClientSession) -> List[str]:
 
 @handle_errors
 async def fetch_website(url: str, session: ClientSession, max_size: int = 16000) -> str:
+    from bs4 import BeautifulSoup  # pylint: disable=import-outside-toplevel
+
     async with session.get(url) as response:
         html = await response.text()
         truncated_html = html[:max_size]
@@ -73,6 +76,8 @@ async def fetch_website(url: str, session: ClientSession, max_size: int = 16000)
 
 async def pdf_loader(file: FileField) -> AsyncGenerator[Tuple[float, str], None]:
     """Reads a PDF file from the request and returns a list of strings"""
+    from pypdf import PdfReader  # pylint: disable=import-outside-toplevel
+
     data = file.file.read()
     pdf = PdfReader(io.BytesIO(data))
     for page, index in enumerate(pdf.pages):
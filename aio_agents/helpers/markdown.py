@@ -1,30 +1,171 @@
+"""Markdown to HTML with one shared parser and memoized code highlighting."""
+import hashlib
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
 from markdown_it import MarkdownIt
-from markdown_it.renderer import RendererHTML
 from markdown_it.rules_inline.linkify import linkify
-from pygments import highlight
-from pygments.formatters import HtmlFormatter  # pylint: disable=no-name-in-module
-from pygments.lexers import get_lexer_by_name
-from pygments.styles import get_style_by_name
+from markdown_it.token import Token
 
+STYLE = "monokai"
 
-def highlight_code(code: str, lang: str, _options: dict) -> str:
-    if not lang:
-        lexer = get_lexer_by_name("md")
-    lexer = get_lexer_by_name(lang)
-    style = get_style_by_name("monokai")
-    formatter = HtmlFormatter(style=style)
-    return highlight(code, lexer, formatter)
+CONTINUABLE = ("bullet_list_open", "ordered_list_open")
 
 
-def render_markdown(markdown: str) -> str:
-    markdownit = MarkdownIt(
+@lru_cache(maxsize=None)
+def get_formatter(style: str = STYLE) -> Any:
+    # pylint: disable=import-outside-toplevel
+    from pygments.formatters import HtmlFormatter  # pylint: disable=no-name-in-module
+    from pygments.styles import get_style_by_name
+
+    return HtmlFormatter(style=get_style_by_name(style))
+
+
+@lru_cache(maxsize=256)
+def get_lexer(lang: str) -> Any:
+    """The lexer of `lang`, markdown when it is empty and plain text if unknown."""
+    # pylint: disable=import-outside-toplevel
+    from pygments.lexers import get_lexer_by_name
+    from pygments.util import ClassNotFound
+
+    try:
+        return get_lexer_by_name(lang or "md")
+    except ClassNotFound:
+        return get_lexer_by_name("text")
+
+
+class CodeHighlighter:
+    """LRU of highlighted code blocks keyed by (lang, digest of the code)."""
+
+    def __init__(self, maxsize: int = 512) -> None:
+        self.maxsize = maxsize
+        self.stats: Counter = Counter()
+        self._blocks: "OrderedDict[Tuple[str, bytes], str]" = OrderedDict()
+
+    def __call__(self, code: str, lang: str, _attrs: Any = None) -> str:
+        key = (lang, hashlib.blake2b(code.encode("utf-8"), digest_size=16).digest())
+        html = self._blocks.get(key)
+        if html is not None:
+            self.stats["hits"] += 1
+            self._blocks.move_to_end(key)
+            return html
+        self.stats["misses"] += 1
+        from pygments import highlight  # pylint: disable=import-outside-toplevel
+
+        html = highlight(code, get_lexer(lang), get_formatter())
+        self._blocks[key] = html
+        while len(self._blocks) > self.maxsize:
+            self._blocks.popitem(last=False)
+        return html
+
+
+highlight_code = CodeHighlighter()
+
+
+def create_parser() -> MarkdownIt:
+    return MarkdownIt(
         "js-default",
         {
             "html": True,
             "linkify": True,
             "typographer": True,
             "highlight": highlight_code,
-            "renderer": RendererHTML(),
         },
     )
-    return markdownit.render(markdown)
+
+
+class IncrementalMarkdown:
+    """
+    Renders markdown that arrives in chunks, like a streamed chat answer.
+
+    Only the last top level block, and blocks before it that could still
+    absorb it, can change as text is appended. Every block before those is
+    rendered once and kept in `committed`, each `feed` parses and renders
+    just the open blocks into `pending`. Reference definitions of the
+    committed text are passed to every parse, and a new or changed one
+    re-renders the whole text, since it can turn committed text into a link.
+    """
+
+    def __init__(self, parser: Optional[MarkdownIt] = None) -> None:
+        self.parser = parser or markdown_parser
+        self.text = ""
+        self.committed = ""
+        self.pending = ""
+        self.references: Dict[str, Tuple[str, str]] = {}
+        self._committed_references: Dict[str, Any] = {}
+        self._tail = ""
+
+    @property
+    def html(self) -> str:
+        return self.committed + self.pending
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        """
+        Appends `chunk` and returns what changed as `(event, html)` pairs:
+        `reset` empties everything committed, `commit` appends to it and
+        `pending` replaces the open block.
+        """
+        self.text += chunk
+        self._tail += chunk
+        changes: List[Tuple[str, str]] = []
+        env = self._parse_env()
+        tokens = self.parser.parse(self._tail, env)
+        if _definitions(env) != self.references and self.committed:
+            self.committed, self._tail = "", self.text
+            self._committed_references = {}
+            env = self._parse_env()
+            tokens = self.parser.parse(self._tail, env)
+            changes.append(("reset", ""))
+        self.references = _definitions(env)
+        starts = [
+            (index, token.map[0])
+            for index, token in enumerate(tokens)
+            if token.level == 0 and token.nesting >= 0 and token.map
+        ]
+        # The block before the open one stays open too when it can still
+        # absorb it: a list ("2" becomes an item once ". b" arrives) or any
+        # block with no blank line in between ("#" turns lazy as "#x").
+        while len(starts) > 1:
+            previous = tokens[starts[-2][0]]
+            if previous.type not in CONTINUABLE and (
+                previous.map is None or previous.map[1] < starts[-1][1]
+            ):
+                break
+            starts.pop()
+        if len(starts) > 1:
+            index, line = starts[-1]
+            html = self._render(tokens[:index], env)
+            lines = self._tail.split("\n")
+            # Definitions in the committed lines can no longer change.
+            committed = self._parse_env()
+            self.parser.parse("\n".join(lines[:line]), committed)
+            self._committed_references = committed["references"]
+            self.committed += html
+            self._tail = "\n".join(lines[line:])
+            tokens = tokens[index:]
+            changes.append(("commit", html))
+        self.pending = self._render(tokens, env)
+        changes.append(("pending", self.pending))
+        return changes
+
+    def _parse_env(self) -> Dict[str, Any]:
+        return {"references": dict(self._committed_references)}
+
+    def _render(self, tokens: List[Token], env: Dict[str, Any]) -> str:
+        return self.parser.renderer.render(tokens, self.parser.options, env)
+
+
+def _definitions(env: Dict[str, Any]) -> Dict[str, Tuple[str, str]]:
+    """The reference definitions of a parse env without their source lines."""
+    return {
+        label: (reference["href"], reference["title"])
+        for label, reference in env.get("references", {}).items()
+    }
+
+
+markdown_parser = create_parser()
+
+
+def render_markdown(markdown: str) -> str:
+    return markdown_parser.render(markdown)
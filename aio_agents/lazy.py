@@ -0,0 +1,80 @@
+"""Deferred construction of heavy dependencies and the post-startup warm-up."""
+import asyncio
+import importlib
+import os
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Tuple, TypeVar, Union
+
+from aiofauna.typedefs import LazyProxy
+from aiofauna.utils import setup_logging
+
+_T = TypeVar("_T")
+
+logger = setup_logging(__name__)
+
+
+class Lazy(LazyProxy[_T]):
+    """Builds the wrapped object on first attribute access."""
+
+    def __init__(self, factory: Callable[[], _T]) -> None:
+        super().__init__()
+        self._factory = factory
+
+    def __load__(self) -> _T:
+        started = perf_counter()
+        proxied = self._factory()
+        elapsed = perf_counter() - started
+        logger.info("Loaded %s in %.3fs", type(proxied).__name__, elapsed)
+        return proxied
+
+
+def aws_client(service: str, **kwargs: Any) -> Any:
+    """A boto3 client created, along with boto3 itself, on first use."""
+    return Lazy(lambda: importlib.import_module("boto3").client(service, **kwargs))
+
+
+class Warmup:
+    """
+    Loads the registered lazy objects in worker threads once the server is
+    listening, so the first requests don't pay for them. `ready` flips when
+    every step finished, failures are logged and left to load on demand.
+    Set `WARMUP=0` to skip it.
+    """
+
+    def __init__(self) -> None:
+        self.steps: List[Tuple[str, Union[Lazy, Callable[[], Any]]]] = []
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.import_seconds = 0.0
+        self.ready = False
+
+    def register(self, name: str, target: Union[Lazy, Callable[[], Any]]) -> None:
+        self.steps.append((name, target))
+
+    async def _step(self, name: str, target: Union[Lazy, Callable[[], Any]]) -> None:
+        load = target.__get_proxied__ if isinstance(target, Lazy) else target
+        started = perf_counter()
+        try:
+            await asyncio.to_thread(load)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.error("Warm-up of %s failed: %s", name, exc)
+            self.errors[name] = str(exc)
+        self.timings[name] = round(perf_counter() - started, 3)
+
+    async def run(self) -> None:
+        if os.environ.get("WARMUP", "1") != "0":
+            await asyncio.gather(*[self._step(*step) for step in self.steps])
+            logger.info("Warm-up finished: %s", self.timings)
+        self.ready = True
+
+    @property
+    def info(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "import_seconds": round(self.import_seconds, 3),
+            "warmup": self.timings,
+            "errors": self.errors,
+        }
+
+
+warmup = Warmup()
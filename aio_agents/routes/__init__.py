@@ -1,3 +1,4 @@
 from .chat import ChatRouter
 from .load import LoadRouter
 from .payment import PaymentsRouter
+from .listing import listing, query_param
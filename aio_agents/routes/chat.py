@@ -1,6 +1,9 @@
 from aiofauna import *
+from aiohttp.web import Request, Response
 
 from ..data import *
+from ..helpers.history import conversations
+from .listing import listing, query_param
 from ..schemas import *
 from ..services import *
 
@@ -20,22 +23,28 @@ class Conversation(Document):
 
     async def fetch(self):
         """Fetches all the nested ids full information"""
-        namespace = await Namespace.get(self.namespace)
-        messages = await ChatMessage.find_many(namespace=self.namespace)
-        messages_with_users = []
-        for message in messages:
-            user = await User.get(message.owner) if message.owner != "agent" else User(name="Agent", sub="agent", picture="/logo.png")  # type:ignore
-            messages_with_users.append(
-                ConversationMessage(
-                    user=user,
-                    content=message.content,
-                )
-            )
+        users = DataLoader.for_request(User)
+        namespace, messages = await asyncio.gather(
+            Namespace.get(self.namespace),
+            ChatMessage.history(self.namespace),
+        )
+        humans = [message.owner for message in messages if message.owner != "agent"]
+        owners, participants = await asyncio.gather(
+            users.load_many(humans), users.load_many(namespace.participants)
+        )
+        owner_by_ref = dict(zip(humans, owners))
+        agent = User(name="Agent", sub="agent", picture="/logo.png")  # type:ignore
         return Conversation(
             namespace=namespace.ref,
             title=namespace.title,
-            participants=await asyncio.gather(*[User.get(participant) for participant in namespace.participants]),
-            messages=messages_with_users,
+            participants=[user for user in participants if user is not None],
+            messages=[
+                ConversationMessage(
+                    user=agent if message.owner == "agent" else owner_by_ref[message.owner],
+                    content=message.content,
+                )
+                for message in messages
+            ],
         )
     
 class ChatRouter(APIRouter):
@@ -63,18 +72,21 @@ class ChatRouter(APIRouter):
         @self.get("/namespace/get/{namespace}")
         async def namespace_get(namespace: str):
             namespace_obj = await Namespace.get(namespace)
-            if (
-                namespace_obj.title == "[New Namespace]"
-                and len(namespace_obj.messages) > 0
-            ):
-                first_prompt = (await ChatMessage.find_many(namespace=namespace))[0]
+            if namespace_obj.title == "[New Namespace]" and namespace_obj.has_messages:
+                first_prompt = (await ChatMessage.log(namespace, limit=1)).data[0]
                 await namespace_obj.set_title(first_prompt.content)
             return await Namespace.get(namespace)
 
         @self.get("/namespace/list")
-        async def namespace_list(user: str):
-            """Lists all namespaces for a user"""
-            return await Namespace.find_many(user=user)
+        async def namespace_list(user: str, request: Request):
+            """Lists the namespaces of a user, a page with `limit` or `after` in
+            the query, NDJSON of all of them with `Accept: application/x-ndjson`"""
+            return await listing(
+                request,
+                lambda limit, after: Namespace.find_page(
+                    limit=limit, after=after, user=user
+                ),
+            )
 
         @self.delete("/namespace")
         async def namespace_delete(id: str):
@@ -82,8 +94,9 @@ class ChatRouter(APIRouter):
             return await Namespace.delete(id)
 
         @self.get("/messages/audio")
-        async def audio_response(text: str, namespace: str, lang: str = "en-US"):
+        async def audio_response(text: str, namespace: str, request: Request):
             """Returns an audio response from a text"""
+            lang = query_param(request, "lang", "en-US")
             text = await self.llm.chat_with_memory(
                 text=text,
                 namespace=namespace,
@@ -95,18 +108,22 @@ class ChatRouter(APIRouter):
             )
 
         @self.get("/messages/list/{namespace}")
-        async def get_messages(namespace: str):
-            """Returns a list of messages from a namespace"""
-            return await ChatMessage.find_many(namespace=namespace)
+        async def get_messages(namespace: str, request: Request):
+            """Returns the messages of a namespace oldest first, a page with
+            `limit` or `after` in the query"""
+            return await listing(
+                request,
+                lambda limit, after: ChatMessage.log(
+                    namespace, limit=limit, after=after
+                ),
+            )
 
         @self.post("/messages/{namespace}")
         async def post_message(namespace: str, message: ChatMessage):
             """Posts a message to a conversation"""
             instance = await message.save()
-            namespace = await Namespace.get(namespace)
-            await namespace.update(
-                namespace.ref,
-                messages=namespace.messages + [instance.ref],  # type:ignore
+            await asyncio.gather(
+                conversations.record(instance), Namespace.count_message(namespace)
             )
             return instance
 
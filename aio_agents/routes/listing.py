@@ -0,0 +1,75 @@
+"""Paged listings, answered as one JSON page or streamed as NDJSON."""
+import json
+from typing import Any, Awaitable, Callable, List, Optional, TypeVar, Union
+
+from aiofauna import FaunaJSONEncoder, Request, setup_logging
+from aiohttp.web import HTTPBadRequest, StreamResponse
+
+from ..data import MAX_BATCH, Page, iterate_pages
+
+_T = TypeVar("_T", str, int, float)
+
+logger = setup_logging(__name__)
+
+NDJSON = "application/x-ndjson"
+
+
+def ndjson_line(document: object) -> bytes:
+    return (
+        json.dumps(document, cls=FaunaJSONEncoder, separators=(",", ":")) + "\n"
+    ).encode("utf-8")
+
+
+def query_param(request: Request, name: str, default: _T) -> _T:
+    """
+    A query string parameter cast to the type of `default`. aiofauna binds the
+    request itself to omitted optional parameters, so handlers read them here.
+    Raises HTTPBadRequest when the value does not cast.
+    """
+    if name not in request.query:
+        return default
+    try:
+        return type(default)(request.query[name])
+    except ValueError as exc:
+        raise HTTPBadRequest(
+            text=json.dumps(
+                {
+                    "status": "error",
+                    "message": f"Invalid {name}: {request.query[name]}",
+                }
+            ),
+            content_type="application/json",
+        ) from exc
+
+
+async def listing(
+    request: Request, fetch: Callable[[int, Optional[str]], Awaitable[Page]]
+) -> Union[Page, List[Any], StreamResponse]:
+    """
+    Answers with the page `fetch(limit, after)` for the `limit` and `after`
+    query parameters. Clients sending `Accept: application/x-ndjson` get every
+    page from `after` on instead, one document per line, written as each page
+    arrives so only one page is ever held in memory. Requests with neither
+    parameter get the bare array of every document, as before paging.
+    """
+    limit = max(1, min(query_param(request, "limit", 50), MAX_BATCH))
+    after = query_param(request, "after", "") or None
+    if NDJSON not in request.headers.get("Accept", ""):
+        if "limit" in request.query or "after" in request.query:
+            return await fetch(limit, after)
+        documents: List[Any] = []
+        async for page in iterate_pages(lambda cursor: fetch(MAX_BATCH, cursor)):
+            documents += page.data
+        return documents
+    response = StreamResponse(headers={"Content-Type": NDJSON})
+    await response.prepare(request)
+    try:
+        async for page in iterate_pages(lambda cursor: fetch(limit, cursor), after):
+            if page.data:
+                await response.write(b"".join(ndjson_line(i) for i in page.data))
+    except ValueError as exc:
+        # Headers are gone already, the last line tells the client it was cut.
+        logger.error("Streaming %s failed: %s", request.path, exc)
+        await response.write(ndjson_line({"error": str(exc)}))
+    await response.write_eof()
+    return response
@@ -1,15 +1,19 @@
+import asyncio
 import json
 
-import pandas as pd
 from aiofauna import *
+from aiohttp.web import Request
 
 from ..data import *
 from ..helpers import *
 from ..tools import *
 from ..utils import *
+from .listing import listing, query_param
 
 logger = setup_logging(__name__)
 
+INGEST_BATCH = 64
+
 
 class LoadRouter(APIRouter):
     def __init__(self, *args, **kwargs):
@@ -23,34 +27,46 @@ class LoadRouter(APIRouter):
                 loader = pdf_loader
             else:
                 loader = text_loader
-            text = ""
-            async for i, chunk in loader(file):
-                await self.llm.ingest(texts=[chunk], namespace=namespace)
-                text += chunk
-            wordcounts = word_cloud(text)
-            upload_file = await upload_handler(
-                file=file, user="agent", namespace=namespace
+            chunks = [chunk async for _, chunk in loader(file)]
+            await self.llm.ingest(texts=chunks, namespace=namespace)
+            counter = await asyncio.to_thread(WordCounter().update, chunks)
+            await NamespaceTerms.record(namespace, counter.counts)
+            wordcounts = counter.top()
+            upload = upload_file(file=file, user="agent", namespace=namespace)
+            # The file and the book are written in one transaction.
+            _, response = await BookOrDocument.save_many(
+                [
+                    upload,
+                    BookOrDocument(
+                        namespace=namespace,
+                        title=upload.name,
+                        file=upload,
+                        wordcloud=[WordCount(**wordcount) for wordcount in wordcounts],
+                    ),
+                ]
             )
-            response = await BookOrDocument(
-                namespace=namespace,
-                title=upload_file.name,
-                file=upload_file,
-                wordcloud=[WordCount(**wordcount) for wordcount in wordcounts],
-            ).save()
             logger.info("Response: %s", response)
             return response
 
         @self.post("/load/website/{namespace}")
         async def load_website(url: str, namespace: str):
             """Loads a website and returns a list of pages"""
+            chunks = []
             async for i, chunk in website_loader(url):
-                await self.llm.ingest(texts=[chunk], namespace=namespace)
-                logger.info("Progress: %s", i)
+                chunks.append(chunk)
+                if len(chunks) == INGEST_BATCH:
+                    await self.llm.ingest(texts=chunks, namespace=namespace)
+                    chunks = []
+                    logger.info("Progress: %s", i)
+            if chunks:
+                await self.llm.ingest(texts=chunks, namespace=namespace)
             return {"message": "Success"}
 
         @self.post("/load/csv/{namespace}")
         async def load_csv(namespace: str, file: FileField):
             """Loads a CSV file and returns a list of pages"""
+            import pandas as pd  # pylint: disable=import-outside-toplevel
+
             df = pd.read_csv(file.file)
             json_data = df.to_json(orient="records")
             data = json.loads(json_data)
@@ -61,9 +77,27 @@ class LoadRouter(APIRouter):
             ).save()
 
         @self.get("/books/{namespace}")
-        async def get_book(namespace: str):
-            """Gets a book"""
-            return await BookOrDocument.find_many(namespace=namespace)
+        async def get_book(namespace: str, request: Request):
+            """Gets a page of the books of a namespace"""
+            return await listing(
+                request,
+                lambda limit, after: BookOrDocument.find_page(
+                    limit=limit, after=after, namespace=namespace
+                ),
+            )
+
+        @self.get("/terms/{namespace}")
+        async def get_terms(namespace: str, request: Request):
+            """Gets the most frequent terms across the documents of a namespace"""
+            k = query_param(request, "k", 25)
+            terms = await NamespaceTerms.find_unique(namespace=namespace)
+            if terms is None:
+                return {"namespace": namespace, "total": 0, "terms": []}
+            return {
+                "namespace": namespace,
+                "total": terms.total,
+                "terms": [i.dict() for i in terms.heavy[:k]],
+            }
 
         @self.get("/load/urls")
         async def get_urls(url: str):
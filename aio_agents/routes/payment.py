@@ -1,10 +1,12 @@
 from aiofauna import *
 
 from ..data import *
+from ..lazy import aws_client
 from ..schemas import *
 from ..services import *
 
 logger = setup_logging(__name__)
+ses = aws_client("ses")
 
 
 class PaymentsRouter(APIRouter):
@@ -17,7 +19,6 @@ class PaymentsRouter(APIRouter):
             data = await request.json()
             logger.info("Received webhook: %s", data)
             parsed = to_json(data)
-            ses = Session().client("ses")
             ses.send_email(
                 Source="oscar.bahamonde@aiofauna.com",
                 Destination={"ToAddresses": ["oscar.bahamonde@aiofauna.com"]},
@@ -2,7 +2,12 @@ from io import BytesIO
 from typing import List, Literal, Optional
 
 from aiofauna import Document, Field, async_io
-from boto3 import Session
+
+from ..lazy import aws_client
+
+polly = aws_client("polly", region_name="us-east-1")
+comprehend = aws_client("comprehend", region_name="us-east-1")
+translate = aws_client("translate", region_name="us-east-1")
 
 
 class Voice(Document):
@@ -12,11 +17,11 @@ class Voice(Document):
 
     @classmethod
     def client(cls):
-        return Session().client("polly", region_name="us-east-1")
+        return polly
 
     @classmethod
     def detector(cls):
-        return Session().client("comprehend", region_name="us-east-1")
+        return comprehend
 
     @classmethod
     @async_io
@@ -87,7 +92,7 @@ class Polly(Document):
 
     @property
     def client(self):
-        return Session().client("polly", region_name="us-east-1")
+        return polly
 
     def synthesize(self):
         return self.client.synthesize_speech(**self.dict(exclude_none=True))
@@ -145,7 +150,7 @@ class Comprehend(Document):
 
     @property
     def client(self):
-        return Session().client("comprehend", region_name="us-east-1")
+        return comprehend
 
     @async_io
     def detect_sentiment(self):
@@ -186,7 +191,7 @@ class Translate(Document):
 
     @property
     def client(self):
-        return Session().client("translate", region_name="us-east-1")
+        return translate
 
     @async_io
     def translate_text(self):
@@ -0,0 +1,79 @@
+"""Pluggable result stores for per-tool memoization of `FunctionDocument` calls."""
+from __future__ import annotations
+
+import json
+import os
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Optional, Tuple
+
+import aioredis
+from aiofauna import setup_logging
+
+logger = setup_logging(__name__)
+
+
+class MemoBackend(ABC):
+    """Stores JSON compatible tool results for `ttl` seconds."""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        ...
+
+
+class LocalMemo(MemoBackend):
+    """In-process LRU with per entry expiry."""
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self._data[key] = (monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+class RedisMemo(MemoBackend):
+    """Shared store, results are visible to every worker."""
+
+    def __init__(self, url: str) -> None:
+        self.redis = aioredis.Redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[Any]:
+        try:
+            data = await self.redis.get(key)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning("Tool memo read failed: %s", exc)
+            return None
+        return None if data is None else json.loads(data)
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        try:
+            await self.redis.set(key, json.dumps(value), ex=max(int(ttl), 1))
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning("Tool memo write failed: %s", exc)
+
+
+def default_backend() -> MemoBackend:
+    """Redis when `TOOL_CACHE=redis` and `REDIS_URL` are set, local otherwise."""
+    if os.environ.get("TOOL_CACHE") == "redis" and os.environ.get("REDIS_URL"):
+        return RedisMemo(os.environ["REDIS_URL"])
+    return LocalMemo()
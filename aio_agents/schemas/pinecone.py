@@ -5,7 +5,7 @@ from uuid import uuid4
 from aiofauna import Document
 from pydantic import Field
 
-from .typedefs import List, MetaData, Query, Value, Vector
+from .typedefs import List, MetaData, Optional, Query, Value, Vector
 
 
 class QueryBuilder:
@@ -69,6 +69,7 @@ class QueryRequest(Document):
     topK: int = Field(default=10)
     filter: dict = Field(...)
     includeMetadata: bool = Field(default=True)
+    includeValues: bool = Field(default=False)
     vector: Vector = Field(...)
 
 
@@ -76,6 +77,7 @@ class QueryMatch(Document):
     id: str = Field(...)
     score: float = Field(...)
     metadata: MetaData = Field(...)
+    values: Optional[Vector] = Field(default=None)
 
 
 class QueryResponse(Document):
@@ -1,16 +1,35 @@
 from __future__ import annotations
 
+import hashlib
+import json
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Literal, Type, TypeVar, Union
+from collections import Counter
+from typing import (
+    Any,
+    ClassVar,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
 from aiofauna import Document, handle_errors, setup_logging
+from aiofauna.json import to_json
 from aiofauna.utils import process_time
 from pydantic import BaseModel  # pylint: disable=no-name-in-module
 
 from ..utils import snakify
+from .memo import MemoBackend, default_backend
 
 Role = Literal["assistant", "user", "system", "function"]
-Model = Literal["gpt-4-0613", "gpt-3.5-turbo-16k-0613"]
+Model = Literal[
+    "gpt-4-0613", "gpt-3.5-turbo-16k-0613", "gpt-4-1106-preview", "gpt-3.5-turbo-1106"
+]
+PARALLEL_TOOL_MODELS = ("gpt-4-1106-preview", "gpt-3.5-turbo-1106")
 Size = Literal["256x256", "512x512", "1024x1024"]
 Format = Literal["url", "base64"]
 Vector = List[float]
@@ -37,8 +56,16 @@ class FunctionCall(Document):
 
 
 class FunctionDocument(BaseModel, ABC):
+    timeout: ClassVar[float] = 30
+    cache_ttl: ClassVar[Optional[float]] = None
+    cache_key: ClassVar[Optional[Tuple[str, ...]]] = None
+    cache_backend: ClassVar[MemoBackend] = default_backend()
+    openaischema: ClassVar[Dict[str, Any]]
+
     class Metadata:
-        subclasses: List[Type[F]] = []
+        subclasses: List[Type["FunctionDocument"]] = []
+        registry: Dict[str, Type["FunctionDocument"]] = {}
+        memo_stats: Dict[str, Counter] = {}
 
     def __init__(self, **kwargs) -> None:
         super().__init__(**kwargs)
@@ -69,13 +96,41 @@ class FunctionDocument(BaseModel, ABC):
         }
         logger.debug("%s function schema: %s", cls.__name__, cls.openaischema)
         cls.Metadata.subclasses.append(cls)
+        cls.Metadata.registry[cls.__name__] = cls
+
+    def memo_key(self) -> Optional[str]:
+        """Result cache key built from the validated `cache_key` fields.
+
+        Tools opt in by setting `cache_ttl`, `None` disables memoization.
+        """
+        if self.cache_ttl is None:
+            return None
+        fields = set(self.cache_key) if self.cache_key is not None else None
+        payload = json.dumps(
+            self.dict(include=fields), sort_keys=True, separators=(",", ":"), default=str
+        )
+        digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return f"tool:{self.__class__.__name__}:{digest}"
 
     @process_time
     @handle_errors
     async def __call__(self, **kwargs: Any) -> FunctionCall:
+        name = snakify(self.__class__.__name__)
+        key = self.memo_key()
+        if key is not None:
+            stats = self.Metadata.memo_stats.setdefault(name, Counter())
+            cached = await self.cache_backend.get(key)
+            if cached is not None:
+                stats["hits"] += 1
+                return FunctionCall(name=name, data=cached)
+            stats["misses"] += 1
+
         response = await self.run(**kwargs)
 
-        name = snakify(self.__class__.__name__)
+        if key is not None:
+            data = json.loads(to_json(response, pretty=False))
+            await self.cache_backend.set(key, data, self.cache_ttl)  # type: ignore
+            return FunctionCall(name=name, data=data)
 
         return FunctionCall(name=name, data=response)
 
@@ -1,3 +1,12 @@
 from .auth import *
+from .batching import *
+from .cache import *
+from .context import *
 from .openai import *
 from .pinecone import *
+from .ratelimit import *
+from .singleflight import *
+from .sketch import *
+from .streaming import *
+from .toolindex import *
+from .vectorstore import *
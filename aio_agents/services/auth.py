@@ -9,7 +9,7 @@ from ..data import *
 
 
 class AuthClient(APIClient):
-    base_url: str = field(default=environ["AUTH0_URL"])
+    base_url: str = field(default_factory=lambda: environ["AUTH0_URL"])
     headers: dict = field(default_factory=lambda: {"Content-Type": "application/json"})
 
     async def user_info(self, token: str):
@@ -0,0 +1,118 @@
+"""Dynamic micro-batching of concurrent embedding requests."""
+from __future__ import annotations
+
+import asyncio
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Set, Tuple
+
+import openai
+from aiofauna import setup_logging
+
+from ..schemas.typedefs import Vector
+from .ratelimit import (
+    Priority,
+    count_tokens,
+    create_embedding_request,
+    current_priority,
+    priority_class,
+)
+
+logger = setup_logging(__name__)
+
+Pending = Tuple[str, int, Priority, "asyncio.Future[Vector]"]
+
+
+@dataclass
+class EmbeddingBatcher:
+    """
+    Collects embedding requests from independent coroutines and sends them as
+    one batched API call.
+
+    A batch is flushed when `max_wait_ms` has passed since its first request or
+    as soon as it holds `max_batch_tokens` tokens or `max_batch_size` inputs,
+    whichever comes first. Each caller gets its own vector back. Inputs over
+    `max_input_tokens` are refused before queuing, and a batch the API rejects
+    is retried one input at a time so only the bad input's caller fails.
+    """
+
+    model: str = field(default="text-embedding-ada-002")
+    max_wait_ms: float = field(default=10)
+    max_batch_tokens: int = field(default=32000)
+    max_batch_size: int = field(default=2048)
+    max_input_tokens: int = field(default=8191)
+    stats: Counter = field(default_factory=Counter)
+    _pending: List[Pending] = field(default_factory=list, repr=False)
+    _tokens: int = field(default=0, repr=False)
+    _timer: Optional[asyncio.TimerHandle] = field(default=None, repr=False)
+    _sending: Set[asyncio.Task] = field(default_factory=set, repr=False)
+
+    async def embed(self, text: str, priority: Optional[Priority] = None) -> Vector:
+        """Queues `text` for the next batch and waits for its vector."""
+        tokens = count_tokens(text, self.model)
+        if tokens > self.max_input_tokens:
+            self.stats["oversize"] += 1
+            raise ValueError(
+                f"Input of {tokens} tokens exceeds {self.max_input_tokens} tokens"
+            )
+        if self._pending and (
+            self._tokens + tokens > self.max_batch_tokens
+            or len(self._pending) >= self.max_batch_size
+        ):
+            self.flush()
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[Vector]" = loop.create_future()
+        self._pending.append(
+            (text, tokens, priority or current_priority.get(), future)
+        )
+        self._tokens += tokens
+        if self._timer is None:
+            self._timer = loop.call_later(self.max_wait_ms / 1000, self.flush)
+        return await future
+
+    def flush(self) -> None:
+        """Sends whatever is pending as one request."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._tokens = self._pending, [], 0
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: List[Pending]) -> None:
+        self.stats["batches"] += 1
+        self.stats["inputs"] += len(batch)
+        self.stats["tokens"] += sum(tokens for _, tokens, _, _ in batch)
+        try:
+            with priority_class(min(priority for _, _, priority, _ in batch)):
+                response: Any = await create_embedding_request(
+                    model=self.model, input=[text for text, _, _, _ in batch]
+                )
+            vectors = [
+                item["embedding"]
+                for item in sorted(response["data"], key=lambda x: x["index"])
+            ]
+        except openai.error.InvalidRequestError as exc:
+            if len(batch) == 1:
+                future = batch[0][3]
+                if not future.done():
+                    future.set_exception(exc)
+                return
+            logger.error("Embedding batch of %s rejected: %s", len(batch), exc)
+            self.stats["split"] += 1
+            await asyncio.gather(*[self._send([item]) for item in batch])
+            return
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.error("Embedding batch of %s failed: %s", len(batch), exc)
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (*_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+
+embedding_batcher: EmbeddingBatcher = EmbeddingBatcher()
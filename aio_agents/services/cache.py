@@ -0,0 +1,158 @@
+"""Exact-match completion cache with a local LRU tier and a shared Redis tier."""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Union
+
+import aioredis
+from aiofauna import setup_logging
+
+from .ratelimit import create_chat_completion
+from .singleflight import flights
+
+logger = setup_logging(__name__)
+
+
+def completion_key(
+    model: str,
+    messages: List[Dict[str, Any]],
+    functions: Optional[Union[str, List[Dict[str, Any]]]] = None,
+    temperature: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+) -> str:
+    """Canonical hash of everything that determines a completion."""
+    payload = json.dumps(
+        {
+            "model": model,
+            "messages": messages,
+            "functions": functions,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return "completion:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CompletionCache:
+    """
+    Two tier cache for chat completions.
+
+    Lookups hit the in-process LRU first and fall back to Redis, a shared hit is
+    promoted to the local tier. Redis is optional and any error talking to it
+    degrades to local only caching.
+    """
+
+    maxsize: int = field(default=1024)
+    ttl: int = field(default=60 * 60 * 24)
+    redis_url: Optional[str] = field(
+        default_factory=lambda: os.environ.get("REDIS_URL"), repr=False
+    )
+    stats: Dict[str, int] = field(
+        default_factory=lambda: {
+            "local_hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "bypassed": 0,
+        }
+    )
+    _local: "OrderedDict[str, Any]" = field(default_factory=OrderedDict, repr=False)
+    _redis: Optional[aioredis.Redis] = field(default=None, repr=False)
+
+    @property
+    def redis(self) -> Optional[aioredis.Redis]:
+        if self._redis is None and self.redis_url:
+            self._redis = aioredis.Redis.from_url(self.redis_url)
+        return self._redis
+
+    def accepts(self, temperature: float, cache: Optional[bool] = None) -> bool:
+        """Whether a call may be served from cache.
+
+        An explicit `cache` flag wins, otherwise only deterministic (temperature 0)
+        calls are cached.
+        """
+        enabled = temperature == 0 if cache is None else cache
+        if not enabled:
+            self.stats["bypassed"] += 1
+        return enabled
+
+    async def get(self, key: str) -> Optional[Any]:
+        if key in self._local:
+            self._local.move_to_end(key)
+            self.stats["local_hits"] += 1
+            return self._local[key]
+        if self.redis is not None:
+            try:
+                data = await self.redis.get(key)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.warning("Completion cache read failed: %s", exc)
+                data = None
+            if data is not None:
+                value = json.loads(data)
+                self._remember(key, value)
+                self.stats["shared_hits"] += 1
+                return value
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: Any) -> None:
+        self._remember(key, value)
+        self.stats["stores"] += 1
+        if self.redis is not None:
+            try:
+                await self.redis.set(key, json.dumps(value), ex=self.ttl)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.warning("Completion cache write failed: %s", exc)
+
+    def _remember(self, key: str, value: Any) -> None:
+        self._local[key] = value
+        self._local.move_to_end(key)
+        while len(self._local) > self.maxsize:
+            self._local.popitem(last=False)
+
+    def clear(self) -> None:
+        self._local.clear()
+
+
+completion_cache = CompletionCache()
+
+
+async def cached_chat_completion(
+    cache: Optional[bool] = None, schemas: Optional[str] = None, **request: Any
+) -> Dict[str, Any]:
+    """Rate limited chat completion served through the completion cache.
+
+    Arguments:
+    cache -- Per call override, `False` bypasses the cache and `True` forces it.
+    schemas -- Serialized function schemas to key on instead of the request's.
+    request -- Keyword arguments for the OpenAI chat completion endpoint.
+    """
+    if not completion_cache.accepts(request.get("temperature", 1), cache):
+        return await create_chat_completion(**request)
+    key = completion_key(
+        model=request["model"],
+        messages=request["messages"],
+        functions=schemas or request.get("functions") or request.get("tools"),
+        temperature=request.get("temperature"),
+        max_tokens=request.get("max_tokens"),
+    )
+    cached = await completion_cache.get(key)
+    if cached is not None:
+        logger.info("Completion cache hit %s", key)
+        return cached
+
+    async def fill():
+        response = await create_chat_completion(**request)
+        await completion_cache.set(key, response)
+        return response
+
+    return await flights.do(key, fill)
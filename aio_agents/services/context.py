@@ -0,0 +1,80 @@
+"""Token-budgeted retrieval context assembly with MMR diversification."""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+
+from ..schemas.pinecone import QueryMatch, Vector
+from .ratelimit import count_tokens
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+@dataclass
+class ContextBuilder:
+    """
+    Turns retrieved matches into a compact prompt context.
+
+    Candidates are ranked with maximal marginal relevance, near duplicates
+    (cosine >= `duplicate_threshold` to an already selected chunk) are dropped
+    and chunks are packed until `max_tokens` is reached. Only the chunk text is
+    emitted, numbered in selection order.
+    """
+
+    max_tokens: int = field(default=1500)
+    candidates: int = field(default=12)
+    diversity: float = field(default=0.3)
+    duplicate_threshold: float = field(default=0.95)
+    model: str = field(default="gpt-4-0613")
+
+    def select(
+        self, matches: List[QueryMatch], vector: Optional[Vector] = None
+    ) -> List[QueryMatch]:
+        """MMR ordering of `matches`, near duplicates removed."""
+        matches = [match for match in matches if match.metadata.get("text")]
+        if not matches or any(match.values is None for match in matches):
+            return sorted(matches, key=lambda x: x.score, reverse=True)
+        docs = normalize(np.asarray([match.values for match in matches], np.float32))
+        if vector is not None:
+            relevance = docs @ normalize(np.asarray(vector, np.float32))
+        else:
+            relevance = np.asarray([match.score for match in matches], np.float32)
+        similarity = docs @ docs.T
+        selected: List[int] = []
+        remaining = list(range(len(matches)))
+        while remaining:
+            if selected:
+                redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining), np.float32)
+            scores = (1 - self.diversity) * relevance[remaining] - (
+                self.diversity * redundancy
+            )
+            best = int(np.argmax(scores))
+            index = remaining.pop(best)
+            if redundancy[best] < self.duplicate_threshold:
+                selected.append(index)
+        return [matches[i] for i in selected]
+
+    def build(self, matches: List[QueryMatch], vector: Optional[Vector] = None) -> str:
+        """Deduplicated, diversified context that fits in the token budget."""
+        chunks: List[str] = []
+        budget = self.max_tokens
+        seen = set()
+        for match in self.select(matches, vector):
+            text = str(match.metadata["text"]).strip()
+            if text in seen:
+                continue
+            tokens = count_tokens(text, self.model) + 4
+            if tokens > budget:
+                continue
+            seen.add(text)
+            budget -= tokens
+            chunks.append(f"[{len(chunks) + 1}] {text}")
+        return "\n\n".join(chunks)
@@ -2,7 +2,7 @@ import asyncio
 import json
 import os
 from dataclasses import dataclass, field
-from typing import Any, List, Optional, Type
+from typing import Any, AsyncIterator, Dict, List, Optional, Type, Union
 
 import openai
 from aiofauna import chunker
@@ -10,14 +10,27 @@ from tqdm import tqdm
 
 from ..schemas.openai import CreateImageRequest, CreateImageResponse, Model
 from ..schemas.typedefs import (
-    F,
+    PARALLEL_TOOL_MODELS,
     FunctionCall,
     FunctionDocument,
     Vector,
     handle_errors,
     setup_logging,
 )
+from .batching import EmbeddingBatcher, embedding_batcher
+from .cache import CompletionCache, cached_chat_completion, completion_cache
+from .context import ContextBuilder
 from .pinecone import Embedding, PineconeClient, Query, QueryBuilder
+from .ratelimit import (
+    Priority,
+    create_chat_completion,
+    priority_class,
+    throttled,
+)
+from .singleflight import flight_key, flights
+from .streaming import ArgumentsBuffer, ToolCallAssembler
+from .toolindex import ToolSelector, tool_selector
+from .vectorstore import LocalVectorIndex, vector_client
 
 logger = setup_logging(__name__)
 
@@ -25,12 +38,20 @@ logger = setup_logging(__name__)
 @dataclass
 class LLMStack:
     model: Model = field(default_factory=lambda: "gpt-4-0613")
-    base_url: str = field(default_factory=lambda: os.environ["PINECONE_API_URL"])
-    api_key: str = field(default_factory=lambda: os.environ["PINECONE_API_KEY"])
+    # Read when the stack is built at import, so a missing variable can't stop it.
+    base_url: str = field(
+        default_factory=lambda: os.environ.get("PINECONE_API_URL", "")
+    )
+    api_key: str = field(default_factory=lambda: os.environ.get("PINECONE_API_KEY", ""))
+    cache: CompletionCache = field(default_factory=lambda: completion_cache)
+    batcher: EmbeddingBatcher = field(default_factory=lambda: embedding_batcher)
+    context_builder: ContextBuilder = field(default_factory=ContextBuilder)
+    tool_selector: ToolSelector = field(default_factory=lambda: tool_selector)
 
     @property
-    def pinecone(self) -> PineconeClient:
-        return PineconeClient()
+    def pinecone(self) -> Union[PineconeClient, LocalVectorIndex]:
+        """Vector index client, the in-process index when `VECTOR_STORE=local`."""
+        return vector_client()
 
     @handle_errors
     async def query_vectors(self, vector: Vector, query: Query):
@@ -40,8 +61,32 @@ class LLMStack:
         return [i.metadata for i in response]
 
     @handle_errors
-    async def chat(self, text: str, context: Optional[str] = None) -> str:
-        """Chat completion with no functions."""
+    async def retrieve_context(self, text: str, namespace: str = "default") -> str:
+        """Similarity search packed into a deduplicated, token-bounded context."""
+        builder = QueryBuilder()
+        query: Any = (builder("namespace") == namespace).query
+        vector = await self.create_embedding(text)
+        response = await self.pinecone.query(
+            expr=query,
+            vector=vector,
+            topK=self.context_builder.candidates,
+            includeValues=True,
+        )
+        return self.context_builder.build(response.matches, vector)
+
+    @handle_errors
+    async def chat(
+        self,
+        text: str,
+        context: Optional[str] = None,
+        temperature: float = 1,
+        cache: Optional[bool] = None,
+    ) -> str:
+        """Chat completion with no functions.
+
+        Deterministic calls (temperature 0) are served from the completion cache
+        unless `cache=False` is passed.
+        """
         if context is None:
             messages = [{"role": "user", "content": text}]
         else:
@@ -50,8 +95,12 @@ class LLMStack:
                 {"role": "system", "content": context},
             ]
         logger.info("Chat messages: %s", messages)
-        response = await openai.ChatCompletion.acreate(
-            model=self.model, messages=messages, temperature=1, max_tokens=1024
+        response = await cached_chat_completion(
+            cache=cache,
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=1024,
         )
         logger.info("Chat response: %s", response)
         assert isinstance(response, dict)
@@ -68,47 +117,50 @@ class LLMStack:
 
     @handle_errors
     async def create_embedding(self, text: str) -> Vector:
-        """Creates embeddings for the given texts."""
-        response = await openai.Embedding.acreate(
-            model="text-embedding-ada-002",
-            input=text,
+        """Creates embeddings for the given texts.
+
+        Identical texts requested concurrently share a single upstream call and
+        distinct ones are micro-batched with other callers into one request.
+        """
+        return await flights.do(
+            flight_key("embedding", text), lambda: self.batcher.embed(text)
         )
-        return response["data"][0]["embedding"]  # type: ignore
 
     @handle_errors
     async def ingest(
         self, texts: List[str], namespace: str, chunksize: int = 64
     ) -> int:
-        """Ingest bulk data."""
+        """Ingest bulk data, admitted with bulk priority behind interactive calls."""
         count = 0
-        for chunk in tqdm(chunker(texts, chunksize)):
-            vectors = await asyncio.gather(
-                *[self.create_embedding(text) for text in chunk]
-            )
-            metadata = [{"text": text, "namespace": namespace} for text in chunk]
-            embeddings = []
-            for vector, meta in zip(vectors, metadata):
-                embeddings.append(Embedding(values=vector, metadata=meta))  # type: ignore
-            response = await self.pinecone.upsert(embeddings=embeddings)
-            count += response.upsertedCount
+        with priority_class(Priority.BULK):
+            for chunk in tqdm(chunker(texts, chunksize)):
+                vectors = await asyncio.gather(
+                    *[self.create_embedding(text) for text in chunk]
+                )
+                metadata = [{"text": text, "namespace": namespace} for text in chunk]
+                embeddings = []
+                for vector, meta in zip(vectors, metadata):
+                    embeddings.append(Embedding(values=vector, metadata=meta))  # type: ignore
+                response = await self.pinecone.upsert(embeddings=embeddings)
+                count += response.upsertedCount
         return count
 
     @handle_errors
     async def create_image(self, text: str):
         request = CreateImageRequest(prompt=text)
-        response = openai.Image.create(**request.dict(exclude={"response_format"}))
+        response = await throttled(
+            "dall-e",
+            0,
+            lambda: openai.Image.acreate(**request.dict(exclude={"response_format"})),
+        )
         assert isinstance(response, dict)
         return CreateImageResponse(**response).data[0]["url"]
 
     @handle_errors
     async def chat_with_memory(self, text: str, namespace: str = "default") -> str:
         """Chat completion with similarity search retrieval from pinecone"""
-        builder = QueryBuilder()
-        query = (builder("namespace") == namespace).query
-        vector = await self.create_embedding(text)
-        response = await self.query_vectors(vector, query)
-        context = f"Similar results for use query {text}:" + "\n".join(
-            [i["text"] for i in response]  # type: ignore
+        context = f"Similar results for use query {text}:\n\n" + (
+            await self.retrieve_context(text, namespace)
         )
         logger.info("Context: %s", context)
         chat_response = await self.chat(text, context)
@@ -120,24 +172,102 @@ class LLMStack:
         self,  # pylint: disable=dangerous-default-value
         response: dict,
         functions: List[
-            Type[F]
+            Type[FunctionDocument]
         ] = FunctionDocument.Metadata.subclasses,  # pylint: disable=protected-access
         **kwargs: Any,
     ) -> FunctionCall:
         """Parse the response from OpenAI and return the result."""
+        results = [
+            result
+            async for result in self.run_tool_calls(
+                response, functions=functions, **kwargs
+            )
+        ]
+        if len(results) == 1:
+            return results[0]
+        return FunctionCall(name="tool_calls", data=results)
+
+    async def run_tool_calls(
+        self,  # pylint: disable=dangerous-default-value
+        response: dict,
+        functions: List[Type[FunctionDocument]] = FunctionDocument.Metadata.subclasses,
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[FunctionCall]:
+        """
+        Runs every tool call of a completion concurrently and yields the results
+        as they finish.
+
+        Handles both the legacy single `function_call` and parallel `tool_calls`
+        messages. Each tool runs under its own timeout (`timeout` overrides the
+        class `timeout`), a tool that fails or times out yields an error result
+        instead of holding up the others.
+        """
         choice = response["choices"][0]["message"]
-        if "function_call" in choice:
-            function_call_ = choice["function_call"]
-            name = function_call_["name"]
-            arguments = function_call_["arguments"]
-            for i in functions:
-                if i.__name__ == name:
-                    result = await i(**json.loads(arguments))(**kwargs)  # type: ignore
-                    break
-            else:
-                raise ValueError(f"Function {name} not found")
-            return result
-        return FunctionCall(name="chat", data=choice["content"])
+        calls = [call["function"] for call in choice.get("tool_calls") or []]
+        if choice.get("function_call"):
+            calls.append(choice["function_call"])
+        if not calls:
+            yield FunctionCall(name="chat", data=choice["content"])
+            return
+        registry = self.tool_registry(functions)
+
+        async def run(call: Dict[str, str]) -> FunctionCall:
+            try:
+                return await self.run_tool(
+                    registry, call["name"], json.loads(call["arguments"]), timeout, **kwargs
+                )
+            except Exception as exc:  # pylint: disable=broad-except
+                if len(calls) == 1:
+                    raise
+                logger.error("Function %s failed: %s", call["name"], exc)
+                return FunctionCall(name=call["name"], data={"error": str(exc)})
+
+        for result in asyncio.as_completed([run(call) for call in calls]):
+            yield await result
+
+    def tool_registry(
+        self, functions: List[Type[FunctionDocument]]
+    ) -> Dict[str, Type[FunctionDocument]]:
+        """Name index of `functions`, the prebuilt registry for the default set."""
+        if functions is FunctionDocument.Metadata.subclasses:
+            return FunctionDocument.Metadata.registry
+        return {i.__name__: i for i in functions}
+
+    async def run_tool(
+        self,
+        registry: Dict[str, Type[FunctionDocument]],
+        name: str,
+        arguments: Dict[str, Any],
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> FunctionCall:
+        """Validates and runs one tool, a timeout yields an error result."""
+        if name not in registry:
+            raise ValueError(f"Function {name} not found")
+        tool = registry[name]
+        try:
+            return await asyncio.wait_for(
+                tool(**arguments)(**kwargs),  # type: ignore
+                timeout=timeout or tool.timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.error("Function %s timed out", name)
+            return FunctionCall(name=name, data={"error": "timeout"})
+
+    def tool_request(
+        self,
+        model: Model,
+        functions: List[Type[FunctionDocument]],
+    ) -> Dict[str, Any]:
+        """Function schemas in the shape the model understands."""
+        if model in PARALLEL_TOOL_MODELS:
+            return {
+                "tools": [
+                    {"type": "function", "function": i.openaischema} for i in functions
+                ]
+            }
+        return {"functions": [i.openaischema for i in functions]}
 
     @handle_errors
     async def function_call(
@@ -145,7 +275,10 @@ class LLMStack:
         text: str,
         context: Optional[str] = None,
         model: Model = "gpt-3.5-turbo-16k-0613",
-        functions: List[Type[F]] = FunctionDocument.Metadata.subclasses,
+        functions: List[Type[FunctionDocument]] = FunctionDocument.Metadata.subclasses,
+        temperature: float = 1,
+        cache: Optional[bool] = None,
+        prune: bool = True,
         **kwargs,
     ) -> FunctionCall:
         """
@@ -156,7 +289,119 @@ class LLMStack:
         context -- Optional context for the function
         model -- Model to be used. Defaults to "gpt-4-0613"
         functions -- List of function types. Defaults to all subclasses of FunctionType.
+        temperature -- Sampling temperature, 0 makes the completion cacheable.
+        cache -- Force (True) or bypass (False) the completion cache.
+        prune -- Send only the tool schemas relevant to `text`.
+
+        Models that support parallel tool calls may request several functions in
+        one turn, they run concurrently and are returned together as `tool_calls`.
         """
+        response = await self.function_completion(
+            text, context, model, functions, temperature, cache, prune
+        )
+        return await self.parse_openai_function(response, functions=functions, **kwargs)  # type: ignore
+
+    async def function_calls(
+        self,  # pylint: disable=dangerous-default-value
+        text: str,
+        context: Optional[str] = None,
+        model: Model = "gpt-3.5-turbo-16k-0613",
+        functions: List[Type[FunctionDocument]] = FunctionDocument.Metadata.subclasses,
+        temperature: float = 1,
+        cache: Optional[bool] = None,
+        prune: bool = True,
+        **kwargs,
+    ) -> AsyncIterator[FunctionCall]:
+        """Like `function_call` but yields each tool result as soon as it finishes."""
+        response = await self.function_completion(
+            text, context, model, functions, temperature, cache, prune
+        )
+        async for result in self.run_tool_calls(
+            response, functions=functions, **kwargs
+        ):
+            yield result
+
+    async def stream_function_call(
+        self,  # pylint: disable=dangerous-default-value
+        text: str,
+        context: Optional[str] = None,
+        model: Model = "gpt-3.5-turbo-16k-0613",
+        functions: List[Type[FunctionDocument]] = FunctionDocument.Metadata.subclasses,
+        prune: bool = True,
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[FunctionCall]:
+        """
+        Streaming `function_call` with early tool dispatch.
+
+        Yields `token` events with the model's text as it arrives and starts each
+        tool as soon as its arguments JSON is complete, while the completion is
+        still streaming. Tool progress is reported with `tool_started` events and
+        each result is yielded under the tool name as it finishes.
+        """
+        registry = self.tool_registry(functions)
+        if prune:
+            functions = await self.tool_selector.select(
+                text, self.create_embedding, functions
+            )
+        messages = [{"role": "user", "content": text}]
+        if context is not None:
+            messages.append({"role": "system", "content": context})
+        response = await create_chat_completion(
+            model=model,
+            messages=messages,
+            stream=True,
+            **self.tool_request(model, functions),
+        )
+        assembler = ToolCallAssembler()
+        tasks: List[asyncio.Task] = []
+        done: asyncio.Queue = asyncio.Queue()
+
+        def dispatch(buffer: ArgumentsBuffer) -> FunctionCall:
+            async def run() -> FunctionCall:
+                try:
+                    return await self.run_tool(
+                        registry, buffer.name, buffer.arguments, timeout, **kwargs
+                    )
+                except Exception as exc:  # pylint: disable=broad-except
+                    logger.error("Function %s failed: %s", buffer.name, exc)
+                    return FunctionCall(name=buffer.name, data={"error": str(exc)})
+
+            task = asyncio.create_task(run())
+            task.add_done_callback(done.put_nowait)
+            tasks.append(task)
+            return FunctionCall(name="tool_started", data={"name": buffer.name})
+
+        yielded = 0
+        async for message in response:
+            delta = message["choices"][0]["delta"]
+            if delta.get("content"):
+                yield FunctionCall(name="token", data=delta["content"])
+            for buffer in assembler.feed(delta):
+                yield dispatch(buffer)
+            while not done.empty():
+                yielded += 1
+                yield done.get_nowait().result()
+        for buffer in assembler.pending():
+            yield dispatch(buffer)
+        while yielded < len(tasks):
+            yielded += 1
+            yield (await done.get()).result()
+
+    async def function_completion(
+        self,
+        text: str,
+        context: Optional[str],
+        model: Model,
+        functions: List[Type[FunctionDocument]],
+        temperature: float,
+        cache: Optional[bool],
+        prune: bool = True,
+    ) -> Dict[str, Any]:
+        if prune:
+            functions = await self.tool_selector.select(
+                text, self.create_embedding, functions
+            )
         if context is not None:
             messages = [
                 {"role": "user", "content": text},
@@ -164,17 +409,23 @@ class LLMStack:
             ]
         else:
             messages = [{"role": "user", "content": text}]
-        response = await openai.ChatCompletion.acreate(
+        return await cached_chat_completion(
+            cache=cache,
+            schemas=self.tool_selector.schemas_json(functions),
             model=model,
             messages=messages,
-            functions=[i.openaischema for i in functions],
-            temperature=1,
+            temperature=temperature,
             max_tokens=1024,
+            **self.tool_request(model, functions),
         )
-        return await self.parse_openai_function(response, functions=functions, **kwargs)  # type: ignore
 
-    async def stream_chat(self, text: str, context: Optional[str] = None):
-        """Stream chat completion."""
+    async def stream_chat(
+        self,
+        text: str,
+        context: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+    ):
+        """Stream chat completion, `history` messages are sent before the prompt."""
         if context is None:
             messages = [{"role": "user", "content": text}]
         else:
@@ -182,7 +433,8 @@ class LLMStack:
                 {"role": "user", "content": text},
                 {"role": "system", "content": context},
             ]
-        response = await openai.ChatCompletion.acreate(
+        messages = (history or []) + messages
+        response = await create_chat_completion(
             model=self.model, messages=messages, stream=True
         )
         async for message in response:
@@ -197,20 +449,17 @@ class LLMStack:
         text: str,
         namespace: str = "default",
         context="You are an smart assistant, your goal is to help the user, if you are addresed for your creator or identity,say that you were created by AioFauna Framework team and you are an Smart Assistant",
+        history: Optional[List[Dict[str, str]]] = None,
     ):
         """Stream chat completion with similarity search retrieval from pinecone"""
-        builder = QueryBuilder()
-        query = (builder("namespace") == namespace).query
-        vector = await self.create_embedding(text)
-        response = await self.query_vectors(vector, query)
         ctx = (
             context
             + f"Similar results in the knowledge base for the user's query {text}:\n\n"
-            + "\n\n".join([f"{i}: {i['text']}" for i in response])  # type: ignore
+            + await self.retrieve_context(text, namespace)
         )
         logger.info("Context: %s", ctx)
         chunk = ""
-        async for message in self.stream_chat(text, ctx):
+        async for message in self.stream_chat(text, ctx, history):
             chunk += message
             if len(chunk) > 1000:
                 chunk = chunk.split("\n")
@@ -1,7 +1,7 @@
 """Pinecone API Client for the cheap developers."""
 from __future__ import annotations
 
-from dataclasses import dataclass, field
+from dataclasses import field
 from os import environ
 from typing import List
 
@@ -21,19 +21,23 @@ from ..schemas.pinecone import (
     UpsertResponse,
     Vector,
 )
+from .singleflight import flight_key, flights
 
 load_dotenv()
 
 
-@dataclass(init=True, repr=True, unsafe_hash=False, frozen=False)
 class PineconeClient(APIClient):
     """
     Cheapcone went greedy and removed the namespace feature from the free tier so let's query the API directly with MongoDB Filter Expressions.
     Also it's a good example of streamlining the development of API clients.
     """
 
-    base_url: str = field(default=environ["PINECONE_API_URL"], init=True, repr=True)
-    api_key: str = field(default=environ["PINECONE_API_KEY"], init=True, repr=False)
+    base_url: str = field(
+        default_factory=lambda: environ["PINECONE_API_URL"], init=True, repr=True
+    )
+    api_key: str = field(
+        default_factory=lambda: environ["PINECONE_API_KEY"], init=True, repr=False
+    )
 
     def __load__(self) -> ClientSession:
         """Lazy load the client session."""
@@ -69,7 +73,12 @@ class PineconeClient(APIClient):
                 return UpsertResponse(**await response.json())
 
     async def query(
-        self, expr: Query, vector: Vector, includeMetadata: bool = True, topK: int = 4
+        self,
+        expr: Query,
+        vector: Vector,
+        includeMetadata: bool = True,
+        topK: int = 4,
+        includeValues: bool = False,
     ) -> QueryResponse:
         """query
         Query the vector index.
@@ -79,19 +88,29 @@ class PineconeClient(APIClient):
             vector (Vector): Query vector.
             includeMetadata (bool, optional): Whether to include metadata in the response. Defaults to True.
             topK (int, optional): Number of results to return. Defaults to 10.
+            includeValues (bool, optional): Whether to include the match vectors. Defaults to False.
 
         Returns:
             QueryResponse: Query response.
+
+        Identical queries issued concurrently are coalesced into one request.
         """
-        async with self.__load__() as session:
-            payload = QueryRequest(
-                topK=topK,
-                filter=expr,
-                vector=vector,
-                includeMetadata=includeMetadata,
-            ).dict()
-            async with session.post(
-                "/query",
-                json=payload,
-            ) as response:
-                return QueryResponse(**await response.json())
+        payload = QueryRequest(
+            topK=topK,
+            filter=expr,
+            vector=vector,
+            includeMetadata=includeMetadata,
+            includeValues=includeValues,
+        ).dict()
+
+        async def request() -> QueryResponse:
+            async with self.__load__() as session:
+                async with session.post(
+                    "/query",
+                    json=payload,
+                ) as response:
+                    return QueryResponse(**await response.json())
+
+        return await flights.do(
+            flight_key("query", self.base_url, payload), request
+        )
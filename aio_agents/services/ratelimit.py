@@ -0,0 +1,274 @@
+"""Token-bucket admission control for OpenAI calls with priority classes."""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from functools import lru_cache
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, TypeVar
+
+import openai
+import tiktoken
+from aiofauna import setup_logging
+
+logger = setup_logging(__name__)
+
+_T = TypeVar("_T")
+
+
+class Priority(IntEnum):
+    """Admission classes, lower values are served first."""
+
+    INTERACTIVE = 0
+    DEFAULT = 1
+    BULK = 2
+
+
+current_priority: ContextVar[Priority] = ContextVar(
+    "current_priority", default=Priority.DEFAULT
+)
+
+
+@contextmanager
+def priority_class(priority: Priority):
+    """Runs every OpenAI call issued inside the block with the given priority."""
+    token = current_priority.set(priority)
+    try:
+        yield priority
+    finally:
+        current_priority.reset(token)
+
+
+# Requests and tokens per minute, override with OPENAI_RPM / OPENAI_TPM.
+DEFAULT_LIMITS: Dict[str, Dict[str, int]] = {
+    "gpt-4-0613": {"rpm": 200, "tpm": 40000},
+    "gpt-3.5-turbo-16k-0613": {"rpm": 3500, "tpm": 180000},
+    "text-embedding-ada-002": {"rpm": 3000, "tpm": 1000000},
+    "dall-e": {"rpm": 50, "tpm": 0},
+}
+
+
+@lru_cache(maxsize=None)
+def encoding_for(model: str) -> tiktoken.Encoding:
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4-0613") -> int:
+    """Number of tokens `text` encodes to for `model`."""
+    return len(encoding_for(model).encode(text, disallowed_special=()))
+
+
+def estimate_chat_tokens(
+    model: str,
+    messages: List[Dict[str, Any]],
+    functions: Optional[List[Dict[str, Any]]] = None,
+    max_tokens: Optional[int] = None,
+    tools: Optional[List[Dict[str, Any]]] = None,
+    **_: Any,
+) -> int:
+    """Upper bound of the tokens a chat request is charged against the TPM quota."""
+    tokens = 3
+    for message in messages:
+        tokens += 4 + count_tokens(message.get("content") or "", model)
+    if functions or tools:
+        tokens += count_tokens(json.dumps(functions or tools), model)
+    return tokens + (max_tokens or 1024)
+
+
+def parse_duration(value: str) -> float:
+    """Parses OpenAI reset durations such as `6m0s`, `1.5s` or `20ms`."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(
+        float(amount) * units[unit]
+        for amount, unit in re.findall(r"([\d.]+)(ms|s|m|h)", value)
+    )
+
+
+class TokenBucket:
+    """Continuously refilled bucket, `capacity` units per minute."""
+
+    def __init__(self, capacity: float) -> None:
+        self.capacity = capacity
+        self.level = capacity
+        self.stamp = monotonic()
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / 60
+
+    def refill(self) -> None:
+        now = monotonic()
+        self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` units are available, 0 if they are now."""
+        if self.capacity <= 0:
+            return 0
+        self.refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount: float) -> None:
+        if self.capacity > 0:
+            self.level -= amount
+
+
+class RateScheduler:
+    """
+    RPM and TPM token buckets for one model with a priority queue in front.
+
+    Waiters are admitted strictly by (priority, arrival) so interactive calls
+    overtake queued bulk work. The limits adapt to the rate-limit headers
+    OpenAI returns with 429 responses.
+    """
+
+    def __init__(self, rpm: int, tpm: int) -> None:
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+        self.stats: Counter = Counter()
+        self._queue: List[Any] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def acquire(self, tokens: int, priority: Optional[Priority] = None) -> None:
+        """Waits until a request of `tokens` tokens may be sent."""
+        priority = current_priority.get() if priority is None else priority
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), tokens, future))
+        self.stats[f"queued_{priority.name.lower()}"] += 1
+        self._pump()
+        await future
+
+    def settle(self, estimated: int, actual: int) -> None:
+        """Corrects the TPM bucket once the real usage is known."""
+        self.tokens.consume(actual - estimated)
+
+    def adapt(self, headers: Optional[Mapping[str, str]]) -> None:
+        """Adjusts limits and pauses admission from upstream rate-limit headers."""
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        if "x-ratelimit-limit-requests" in headers:
+            self.requests.capacity = float(headers["x-ratelimit-limit-requests"])
+        if "x-ratelimit-limit-tokens" in headers:
+            self.tokens.capacity = float(headers["x-ratelimit-limit-tokens"])
+        if "x-ratelimit-remaining-requests" in headers:
+            self.requests.refill()
+            self.requests.level = min(
+                self.requests.level, float(headers["x-ratelimit-remaining-requests"])
+            )
+        if "x-ratelimit-remaining-tokens" in headers:
+            self.tokens.refill()
+            self.tokens.level = min(
+                self.tokens.level, float(headers["x-ratelimit-remaining-tokens"])
+            )
+        pause = max(
+            [
+                parse_duration(headers[name])
+                for name in ("retry-after", "x-ratelimit-reset-requests")
+                if name in headers
+            ]
+            or [1.0]
+        )
+        self.paused_until = max(self.paused_until, monotonic() + pause)
+        self.stats["throttled"] += 1
+        logger.warning("Rate limited upstream, pausing admission for %ss", pause)
+        self._pump()
+
+    def _pump(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._queue:
+            priority, _, tokens, future = self._queue[0]
+            if future.done():
+                heapq.heappop(self._queue)
+                continue
+            wait = max(
+                self.paused_until - monotonic(),
+                self.requests.delay(1),
+                self.tokens.delay(tokens),
+            )
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._pump)
+                return
+            heapq.heappop(self._queue)
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            self.stats[f"admitted_{priority.name.lower()}"] += 1
+            future.set_result(None)
+
+
+_schedulers: Dict[str, RateScheduler] = {}
+
+
+def scheduler_for(model: str) -> RateScheduler:
+    """Per model scheduler, OpenAI quotas are tracked per model."""
+    if model not in _schedulers:
+        limits = DEFAULT_LIMITS.get(model, {"rpm": 3500, "tpm": 90000})
+        _schedulers[model] = RateScheduler(
+            rpm=int(os.environ.get("OPENAI_RPM", limits["rpm"])),
+            tpm=int(os.environ.get("OPENAI_TPM", limits["tpm"])),
+        )
+    return _schedulers[model]
+
+
+def scheduler_stats() -> Dict[str, Dict[str, int]]:
+    return {model: dict(s.stats) for model, s in _schedulers.items()}
+
+
+async def throttled(
+    model: str, tokens: int, call: Callable[[], Awaitable[_T]], retries: int = 3
+) -> _T:
+    """Admits `call` through the model scheduler and retries it on 429s."""
+    scheduler = scheduler_for(model)
+    for attempt in range(retries + 1):
+        await scheduler.acquire(tokens)
+        try:
+            return await call()
+        except openai.error.RateLimitError as exc:
+            scheduler.adapt(exc.headers)
+            if attempt == retries:
+                raise
+    raise RuntimeError("unreachable")
+
+
+async def create_chat_completion(**request: Any) -> Any:
+    """`openai.ChatCompletion.acreate` behind the admission scheduler."""
+    model = request["model"]
+    estimated = estimate_chat_tokens(**request)
+    response = await throttled(
+        model, estimated, lambda: openai.ChatCompletion.acreate(**request)
+    )
+    if not request.get("stream"):
+        usage = response.get("usage") or {}
+        scheduler_for(model).settle(estimated, usage.get("total_tokens", estimated))
+    return response
+
+
+async def create_embedding_request(**request: Any) -> Any:
+    """`openai.Embedding.acreate` behind the admission scheduler."""
+    inputs = request["input"]
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    tokens = sum(count_tokens(text, request["model"]) for text in inputs)
+    return await throttled(
+        request["model"], tokens, lambda: openai.Embedding.acreate(**request)
+    )
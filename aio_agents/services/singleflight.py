@@ -0,0 +1,71 @@
+"""Single-flight coalescing of identical in-flight upstream calls."""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+from aiofauna import setup_logging
+
+logger = setup_logging(__name__)
+
+_T = TypeVar("_T")
+
+
+def flight_key(kind: str, *parts: Any) -> str:
+    """Builds a `kind:sha256` key from any JSON serializable parts."""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return f"{kind}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+class SingleFlight:
+    """
+    Concurrent callers with the same key share one in-flight call.
+
+    The shared call runs as its own task and every caller awaits it through
+    `asyncio.shield`, so cancelling one waiter never cancels the call for the
+    others. Keys are prefixed with their kind (`embedding:`, `query:`...) and
+    the counters are broken down by it.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.leaders: Counter = Counter()
+        self.coalesced: Counter = Counter()
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inflight": len(self._inflight),
+            "calls": sum(self.leaders.values()),
+            "coalesced": sum(self.coalesced.values()),
+            "by_kind": {
+                kind: {"calls": self.leaders[kind], "coalesced": self.coalesced[kind]}
+                for kind in self.leaders
+            },
+        }
+
+    async def do(self, key: str, func: Callable[[], Awaitable[_T]]) -> _T:
+        """Runs `func` once per key, sharing its result with concurrent callers."""
+        kind = key.split(":", 1)[0]
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders[kind] += 1
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.coalesced[kind] += 1
+            logger.debug("Coalesced %s", key)
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark as retrieved when every waiter went away
+
+
+flights = SingleFlight()
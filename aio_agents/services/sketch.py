@@ -0,0 +1,139 @@
+"""Mergeable streaming summaries of term frequencies."""
+from __future__ import annotations
+
+import base64
+import hashlib
+import heapq
+import zlib
+from dataclasses import dataclass, field
+from operator import itemgetter
+from typing import Any, Dict, List, Mapping, Tuple
+
+import numpy as np
+
+
+def _hashes(word: str, depth: int, width: int) -> np.ndarray:
+    """`depth` column indexes for `word`, stable across processes."""
+    digest = hashlib.blake2b(word.encode("utf-8"), digest_size=16).digest()
+    first = int.from_bytes(digest[:8], "little")
+    second = int.from_bytes(digest[8:], "little") | 1
+    return np.array([(first + i * second) % width for i in range(depth)])
+
+
+@dataclass
+class CountMinSketch:
+    """Approximate counts for any term, never under the true count."""
+
+    width: int = field(default=2048)
+    depth: int = field(default=4)
+    table: np.ndarray = field(default=None, repr=False)  # type: ignore
+
+    def __post_init__(self) -> None:
+        if self.table is None:
+            self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self._rows = np.arange(self.depth)
+
+    def add(self, word: str, count: int = 1) -> None:
+        self.table[self._rows, _hashes(word, self.depth, self.width)] += count
+
+    def estimate(self, word: str) -> int:
+        return int(self.table[self._rows, _hashes(word, self.depth, self.width)].min())
+
+    def merge(self, other: CountMinSketch) -> None:
+        self.table += other.table
+
+    def dumps(self) -> str:
+        """Compressed, base64 encoded table."""
+        return base64.b64encode(zlib.compress(self.table.tobytes())).decode("ascii")
+
+    @classmethod
+    def loads(cls, data: str, width: int = 2048, depth: int = 4) -> CountMinSketch:
+        table = np.frombuffer(
+            zlib.decompress(base64.b64decode(data)), dtype=np.int64
+        ).reshape(depth, width)
+        return cls(width=width, depth=depth, table=table.copy())
+
+
+@dataclass
+class SpaceSaving:
+    """
+    The `capacity` most frequent terms seen so far. Each counter keeps the
+    overestimation it inherited when it replaced an evicted term, so the true
+    count of a term is within `[count - error, count]`.
+    """
+
+    capacity: int = field(default=100)
+    counters: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+
+    def add(self, word: str, count: int = 1) -> None:
+        if word in self.counters:
+            current, error = self.counters[word]
+            self.counters[word] = (current + count, error)
+        elif len(self.counters) < self.capacity:
+            self.counters[word] = (count, 0)
+        else:
+            evicted = min(self.counters, key=lambda w: self.counters[w][0])
+            floor = self.counters.pop(evicted)[0]
+            self.counters[word] = (floor + count, floor)
+
+    def merge(self, other: SpaceSaving) -> None:
+        """Combines two summaries, terms missing from one side are assumed to
+        have at most that side's smallest count."""
+        floor = self._floor()
+        other_floor = other._floor()
+        merged: Dict[str, Tuple[int, int]] = {}
+        for word in set(self.counters) | set(other.counters):
+            count, error = self.counters.get(word, (floor, floor))
+            other_count, other_error = other.counters.get(
+                word, (other_floor, other_floor)
+            )
+            merged[word] = (count + other_count, error + other_error)
+        self.counters = dict(
+            heapq.nlargest(self.capacity, merged.items(), key=lambda i: i[1][0])
+        )
+
+    def _floor(self) -> int:
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def top(self, k: int) -> List[Tuple[str, int, int]]:
+        return [
+            (word, count, error)
+            for word, (count, error) in heapq.nlargest(
+                k, self.counters.items(), key=lambda i: i[1][0]
+            )
+        ]
+
+
+@dataclass
+class TermSummary:
+    """Count-min sketch plus heavy hitters for a stream of term counts."""
+
+    sketch: CountMinSketch = field(default_factory=CountMinSketch)
+    heavy: SpaceSaving = field(default_factory=SpaceSaving)
+    total: int = field(default=0)
+
+    def update(self, counts: Mapping[str, int]) -> None:
+        """Adds the counts of one document, largest first so frequent terms
+        claim the space-saving counters before the long tail."""
+        for word, count in sorted(counts.items(), key=itemgetter(1), reverse=True):
+            self.sketch.add(word, count)
+            self.heavy.add(word, count)
+            self.total += count
+
+    def merge(self, other: TermSummary) -> None:
+        self.sketch.merge(other.sketch)
+        self.heavy.merge(other.heavy)
+        self.total += other.total
+
+    def top(self, k: int = 25) -> List[Dict[str, Any]]:
+        """The `k` heaviest terms, counts tightened by the sketch."""
+        return [
+            {
+                "word": word,
+                "count": min(count, self.sketch.estimate(word)),
+                "error": error,
+            }
+            for word, count, error in self.heavy.top(k)
+        ]
@@ -0,0 +1,80 @@
+"""Incremental parsing of streamed function call arguments."""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class ArgumentsBuffer:
+    """
+    Accumulates `function_call.arguments` deltas and tells, in O(1) per
+    character, when the JSON object is complete so the tool can start before
+    the completion stream ends.
+    """
+
+    name: str = field(default="")
+    chunks: List[str] = field(default_factory=list)
+    depth: int = field(default=0)
+    started: bool = field(default=False)
+    in_string: bool = field(default=False)
+    escaped: bool = field(default=False)
+    dispatched: bool = field(default=False)
+
+    def feed(self, chunk: str) -> bool:
+        """Adds a delta, returns True once the top level object is closed."""
+        self.chunks.append(chunk)
+        for char in chunk:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+                self.started = True
+            elif char in "}]":
+                self.depth -= 1
+        return self.complete
+
+    @property
+    def complete(self) -> bool:
+        return self.started and self.depth == 0
+
+    @property
+    def arguments(self) -> Dict[str, Any]:
+        return json.loads("".join(self.chunks) or "{}")
+
+
+@dataclass
+class ToolCallAssembler:
+    """Routes streamed deltas to one `ArgumentsBuffer` per tool call."""
+
+    calls: Dict[int, ArgumentsBuffer] = field(default_factory=dict)
+
+    def feed(self, delta: Dict[str, Any]) -> List[ArgumentsBuffer]:
+        """Consumes a delta and returns the calls whose arguments just completed."""
+        ready: List[ArgumentsBuffer] = []
+        parts = [
+            (part.get("index", 0), part.get("function") or {})
+            for part in delta.get("tool_calls") or []
+        ]
+        if delta.get("function_call"):
+            parts.append((0, delta["function_call"]))
+        for index, function in parts:
+            buffer = self.calls.setdefault(index, ArgumentsBuffer())
+            buffer.name += function.get("name") or ""
+            arguments: Optional[str] = function.get("arguments")
+            if arguments and buffer.feed(arguments) and not buffer.dispatched:
+                buffer.dispatched = True
+                ready.append(buffer)
+        return ready
+
+    def pending(self) -> List[ArgumentsBuffer]:
+        """Calls that never closed their JSON, dispatched once the stream ends."""
+        return [buffer for buffer in self.calls.values() if not buffer.dispatched]
@@ -0,0 +1,125 @@
+"""Embedding-based pruning of the function schemas sent with each request."""
+from __future__ import annotations
+
+import asyncio
+import json
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+import numpy as np
+from aiofauna import setup_logging
+
+from ..schemas.typedefs import FunctionDocument, Vector
+from .context import normalize
+
+logger = setup_logging(__name__)
+
+Embed = Callable[[str], Awaitable[Vector]]
+
+
+@dataclass
+class ToolSelector:
+    """
+    Sends only the tools relevant to a request.
+
+    Tool descriptions are embedded once (`warm`, run at startup) and every
+    request text is matched against them by cosine similarity. The `top_k`
+    best tools are kept, the full set is used when the best match scores below
+    `min_score` or the index is not warm yet. Tools registered after `warm`
+    are embedded by the first `select` that sees them, and kept whenever
+    they could not be embedded.
+    """
+
+    top_k: int = field(default=4)
+    min_score: float = field(default=0.75)
+    stats: Counter = field(default_factory=Counter)
+    _names: List[str] = field(default_factory=list, repr=False)
+    _matrix: Optional[np.ndarray] = field(default=None, repr=False)
+    _json: Dict[Tuple[str, ...], str] = field(default_factory=dict, repr=False)
+
+    @staticmethod
+    def describe(function: Type[FunctionDocument]) -> str:
+        schema = function.openaischema  # type: ignore
+        return f"{schema['name']}: {schema['description']}"
+
+    async def warm(self, embed: Embed) -> None:
+        """Embeds every registered tool description."""
+        registry = FunctionDocument.Metadata.registry
+        try:
+            await self.index(embed, list(registry.values()))
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.error("Tool index warm-up failed, sending every tool: %s", exc)
+            return
+        logger.info("Indexed %s tool descriptions", len(self._names))
+
+    async def index(
+        self, embed: Embed, functions: List[Type[FunctionDocument]]
+    ) -> None:
+        """Adds the descriptions of `functions` that are not indexed yet."""
+        functions = [i for i in functions if i.__name__ not in self._names]
+        if not functions:
+            return
+        vectors = await asyncio.gather(*[embed(self.describe(i)) for i in functions])
+        rows = normalize(np.asarray(vectors, dtype=np.float32))
+        # Another call may have indexed some of them while this one awaited.
+        new = [
+            (i.__name__, row)
+            for i, row in zip(functions, rows)
+            if i.__name__ not in self._names
+        ]
+        if not new:
+            return
+        names, added = zip(*new)
+        matrix = np.stack(added)
+        if self._matrix is not None:
+            matrix = np.concatenate([self._matrix, matrix])
+        self._matrix = matrix
+        self._names = self._names + list(names)
+
+    async def select(
+        self,
+        text: str,
+        embed: Embed,
+        functions: Optional[List[Type[FunctionDocument]]] = None,
+    ) -> List[Type[FunctionDocument]]:
+        """Top-k tools for `text` out of `functions` (all registered tools)."""
+        functions = (
+            FunctionDocument.Metadata.subclasses if functions is None else functions
+        )
+        if self._matrix is None or len(functions) <= self.top_k:
+            self.stats["full"] += 1
+            return functions
+        try:
+            await self.index(embed, functions)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.error("Indexing new tools failed: %s", exc)
+        indexed = set(self._names)
+        unindexed = {i.__name__ for i in functions if i.__name__ not in indexed}
+        allowed = {i.__name__ for i in functions}
+        query = normalize(np.asarray(await embed(text), dtype=np.float32))
+        scores = self._matrix @ query
+        ranked = [
+            (float(scores[i]), name)
+            for i, name in enumerate(self._names)
+            if name in allowed
+        ]
+        ranked.sort(reverse=True)
+        if not ranked or ranked[0][0] < self.min_score:
+            self.stats["fallback"] += 1
+            return functions
+        self.stats["pruned"] += 1
+        keep = {name for _, name in ranked[: self.top_k]} | unindexed
+        return [i for i in functions if i.__name__ in keep]
+
+    def schemas_json(self, functions: List[Type[FunctionDocument]]) -> str:
+        """Serialized schemas of `functions`, computed once per tool set."""
+        key = tuple(i.__name__ for i in functions)
+        if key not in self._json:
+            self._json[key] = json.dumps(
+                [i.openaischema for i in functions]  # type: ignore
+            )
+        return self._json[key]
+
+
+tool_selector = ToolSelector()
@@ -0,0 +1,207 @@
+"""In-process vector index with micro-batched top-K query execution."""
+from __future__ import annotations
+
+import asyncio
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Any, Dict, List, Optional, Tuple, Union
+from uuid import uuid4
+
+import numpy as np
+from aiofauna import setup_logging
+
+from ..schemas.pinecone import (
+    Embedding,
+    MetaData,
+    Query,
+    QueryMatch,
+    QueryResponse,
+    UpsertResponse,
+    Vector,
+)
+from .pinecone import PineconeClient
+
+logger = setup_logging(__name__)
+
+
+def query_namespace(expr: Query) -> str:
+    """Extracts the namespace of a `QueryBuilder("namespace") == ns` filter."""
+    filters: Dict[str, Any] = dict(expr.items()) if isinstance(expr, dict) else {}
+    condition = filters.get("namespace", "default")
+    if isinstance(condition, dict):
+        condition = condition.get("$eq", "default")
+    return str(condition or "default")
+
+
+class Partition:
+    """Row-normalized float32 matrix of the vectors of one namespace."""
+
+    def __init__(self) -> None:
+        self.ids: List[str] = []
+        self.metadata: List[MetaData] = []
+        self._rows: List[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    def add(self, id_: str, vector: Vector, metadata: MetaData) -> None:
+        row = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(row)
+        self._rows.append(row / norm if norm else row)
+        self.ids.append(id_)
+        self.metadata.append(metadata)
+        self._matrix = None
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix = np.vstack(self._rows) if self._rows else np.empty((0, 0))
+        return self._matrix
+
+    def snapshot(self) -> Tuple[np.ndarray, List[str], List[MetaData]]:
+        """Consistent view of the partition that is safe to score off-loop."""
+        return self.matrix, list(self.ids), list(self.metadata)
+
+
+def search(
+    snapshot: Tuple[np.ndarray, List[str], List[MetaData]],
+    queries: np.ndarray,
+    top_k: List[int],
+) -> List[List[QueryMatch]]:
+    """Scores every query with one matrix-matrix product and splits the top-K."""
+    matrix, ids, metadata = snapshot
+    if not ids:
+        return [[] for _ in top_k]
+    norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    scores = (queries / norms) @ matrix.T
+    results = []
+    for row, k in zip(scores, top_k):
+        k = min(k, row.shape[0])
+        best = np.argpartition(-row, k - 1)[:k]
+        best = best[np.argsort(-row[best])]
+        results.append(
+            [
+                QueryMatch(
+                    id=ids[i],
+                    score=float(row[i]),
+                    metadata=metadata[i],
+                    values=matrix[i].tolist(),
+                )
+                for i in best
+            ]
+        )
+    return results
+
+
+Pending = Tuple[Vector, int, float, "asyncio.Future[List[QueryMatch]]"]
+
+
+@dataclass
+class LocalVectorIndex:
+    """
+    Self-hosted replacement of `PineconeClient` for local deployments.
+
+    Concurrent queries against the same namespace are gathered into a matrix and
+    answered with a single BLAS matmul. A namespace batch is flushed when it
+    reaches the adaptive target size or when its oldest query has waited
+    `max_wait_ms`, so no caller waits longer than that for batching. The target
+    grows while batches fill up before the deadline and shrinks when they don't.
+    """
+
+    max_wait_ms: float = field(default=5)
+    min_batch: int = field(default=1)
+    max_batch: int = field(default=256)
+    stats: Counter = field(default_factory=Counter)
+    _partitions: Dict[str, Partition] = field(default_factory=dict, repr=False)
+    _pending: Dict[str, List[Pending]] = field(default_factory=dict, repr=False)
+    _target: Dict[str, int] = field(default_factory=dict, repr=False)
+    _timers: Dict[str, asyncio.TimerHandle] = field(default_factory=dict, repr=False)
+
+    def partition(self, namespace: str) -> Partition:
+        if namespace not in self._partitions:
+            self._partitions[namespace] = Partition()
+        return self._partitions[namespace]
+
+    async def upsert(self, embeddings: List[Embedding]) -> UpsertResponse:
+        for embedding in embeddings:
+            namespace = str(embedding.metadata.get("namespace", "default"))
+            self.partition(namespace).add(
+                str(uuid4()), embedding.values, embedding.metadata
+            )
+        return UpsertResponse(upsertedCount=len(embeddings))
+
+    async def query(
+        self,
+        expr: Query,
+        vector: Vector,
+        includeMetadata: bool = True,
+        topK: int = 4,
+        includeValues: bool = False,
+    ) -> QueryResponse:
+        """Same contract as `PineconeClient.query`."""
+        namespace = query_namespace(expr)
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[List[QueryMatch]]" = loop.create_future()
+        pending = self._pending.setdefault(namespace, [])
+        pending.append((vector, topK, monotonic(), future))
+        if len(pending) >= self._target.get(namespace, self.min_batch):
+            self._flush(namespace, full=True)
+        elif namespace not in self._timers:
+            self._timers[namespace] = loop.call_later(
+                self.max_wait_ms / 1000, self._flush, namespace
+            )
+        matches = await future
+        if not includeMetadata:
+            matches = [match.copy(update={"metadata": {}}) for match in matches]
+        if not includeValues:
+            matches = [match.copy(update={"values": None}) for match in matches]
+        return QueryResponse(matches=matches)
+
+    def _flush(self, namespace: str, full: bool = False) -> None:
+        timer = self._timers.pop(namespace, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(namespace, [])
+        if not batch:
+            return
+        target = self._target.get(namespace, self.min_batch)
+        if full:
+            target = min(target * 2, self.max_batch)
+        else:
+            target = max(len(batch), self.min_batch)
+        self._target[namespace] = target
+        asyncio.ensure_future(self._run(namespace, batch))
+
+    async def _run(self, namespace: str, batch: List[Pending]) -> None:
+        self.stats["batches"] += 1
+        self.stats["queries"] += len(batch)
+        queries = np.asarray([vector for vector, *_ in batch], dtype=np.float32)
+        try:
+            results = await asyncio.to_thread(
+                search,
+                self.partition(namespace).snapshot(),
+                queries,
+                [k for _, k, *_ in batch],
+            )
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.error("Vector batch on %s failed: %s", namespace, exc)
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        waited = monotonic() - min(start for _, _, start, _ in batch)
+        self.stats["max_wait_ms"] = max(self.stats["max_wait_ms"], int(waited * 1000))
+        for (*_, future), matches in zip(batch, results):
+            if not future.done():
+                future.set_result(matches)
+
+
+local_index = LocalVectorIndex()
+
+
+def vector_client() -> Union[PineconeClient, LocalVectorIndex]:
+    """`PineconeClient` or the local index depending on `VECTOR_STORE`."""
+    if os.environ.get("VECTOR_STORE", "pinecone") == "local":
+        return local_index
+    return PineconeClient()
@@ -1,2 +1,3 @@
 from .background import *
 from .pubsub import *
+from .invalidation import *
@@ -0,0 +1,15 @@
+"""Standalone worker: `python -m aio_agents.tasks`."""
+import asyncio
+
+from .background import discover, worker
+from .invalidation import bus
+
+
+async def main() -> None:
+    bus.start()
+    await worker.run()
+
+
+if __name__ == "__main__":
+    discover()
+    asyncio.run(main())
@@ -1,19 +1,311 @@
+"""Asyncio-native background tasks.
+
+Coroutines decorated with `task` are registered by name, calling them enqueues
+a job on the broker and returns an `AsyncResult`. A `Worker` running on the
+event loop of each process pulls jobs in batches and awaits the registered
+coroutines. `TASK_BROKER=memory` keeps the broker and the results in process,
+which is what tests and benchmarks use; Redis Streams are used otherwise.
+
+Workers start with the web app, `python -m aio_agents.tasks` runs a standalone
+one.
+"""
+import asyncio
+import importlib
+import json
+import math
+import os
+import pkgutil
+from abc import ABC, abstractmethod
+from collections import Counter
 from functools import wraps
-from typing import Any, Awaitable, Callable, TypeVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+from uuid import uuid4
 
-from celery import Celery
+import aioredis
+from aiofauna.utils import setup_logging
 
 from ..config import env
+from ..lazy import Lazy
+from .streams import FunctionStream
 
 T = TypeVar("T")
 
-worker = Celery("tasks", broker=env.REDIS_URL, backend=env.REDIS_URL)
+logger = setup_logging(__name__)
+
+Job = Dict[str, str]
+
+registry: Dict[str, Callable[..., Awaitable[Any]]] = {}
+batched: Dict[str, int] = {}
+
+
+class Broker(ABC):
+    """Transports jobs from callers to workers."""
+
+    @abstractmethod
+    async def put(self, job: Job) -> None:
+        ...
+
+    @abstractmethod
+    async def consume(self, handler: Callable[[List[Job]], Awaitable[None]]) -> None:
+        """Feeds batches of jobs to `handler` until cancelled."""
+
+
+class ResultBackend(ABC):
+    """Stores the JSON encoded outcome of each job."""
+
+    @abstractmethod
+    async def set(self, task_id: str, value: str) -> None:
+        ...
+
+    @abstractmethod
+    async def get(self, task_id: str, timeout: float) -> Optional[str]:
+        ...
+
+
+class MemoryBroker(Broker):
+    def __init__(self, batch_size: int = 16) -> None:
+        self.batch_size = batch_size
+        self._queue: "Optional[asyncio.Queue[Job]]" = None
+
+    @property
+    def queue(self) -> "asyncio.Queue[Job]":
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    async def put(self, job: Job) -> None:
+        self.queue.put_nowait(job)
+
+    async def consume(self, handler: Callable[[List[Job]], Awaitable[None]]) -> None:
+        while True:
+            jobs = [await self.queue.get()]
+            while len(jobs) < self.batch_size and not self.queue.empty():
+                jobs.append(self.queue.get_nowait())
+            await handler(jobs)
+
+
+class MemoryResults(ResultBackend):
+    def __init__(self) -> None:
+        self.futures: Dict[str, "asyncio.Future[str]"] = {}
+
+    def _future(self, task_id: str) -> "asyncio.Future[str]":
+        if task_id not in self.futures:
+            self.futures[task_id] = asyncio.get_running_loop().create_future()
+        return self.futures[task_id]
+
+    async def set(self, task_id: str, value: str) -> None:
+        future = self._future(task_id)
+        if not future.done():
+            future.set_result(value)
+
+    async def get(self, task_id: str, timeout: float) -> Optional[str]:
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(self._future(task_id)), timeout
+            )
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            if task_id in self.futures and self.futures[task_id].done():
+                del self.futures[task_id]
+
+
+class RedisBroker(Broker):
+    """Jobs go through a consumer group so every process shares the load."""
+
+    def __init__(self, redis: aioredis.Redis, batch_size: int = 16) -> None:
+        self.stream = FunctionStream(
+            redis, group="tasks", jobs_key="tasks:jobs", batch_size=batch_size
+        )
+
+    async def put(self, job: Job) -> None:
+        await self.stream.enqueue(**job)
+
+    async def consume(self, handler: Callable[[List[Job]], Awaitable[None]]) -> None:
+        await self.stream.run_batches(handler)
+
+
+class RedisResults(ResultBackend):
+    def __init__(self, redis: aioredis.Redis, ttl: int = 3600) -> None:
+        self.redis = redis
+        self.ttl = ttl
+
+    @staticmethod
+    def key(task_id: str) -> str:
+        return f"tasks:result:{task_id}"
+
+    async def set(self, task_id: str, value: str) -> None:
+        key = self.key(task_id)
+        await self.redis.rpush(key, value)
+        await self.redis.expire(key, self.ttl)
+
+    async def get(self, task_id: str, timeout: float) -> Optional[str]:
+        # A zero timeout blocks forever in Redis, which only takes whole seconds.
+        response = await self.redis.blpop(
+            self.key(task_id), timeout=max(1, math.ceil(timeout))
+        )
+        return None if response is None else response[1].decode("utf-8")
+
+
+class TaskError(Exception):
+    """Raised by `AsyncResult.get` when the task raised."""
+
+
+class AsyncResult:
+    """Handle to the outcome of an enqueued job."""
+
+    def __init__(self, task_id: str, backend: ResultBackend) -> None:
+        self.id = task_id
+        self.backend = backend
+        self._value: Optional[Dict[str, Any]] = None
+
+    async def get(self, timeout: float = 60) -> Any:
+        if self._value is None:
+            data = await self.backend.get(self.id, timeout)
+            if data is None:
+                raise asyncio.TimeoutError(f"Task {self.id} did not finish")
+            self._value = json.loads(data)
+        if "error" in self._value:
+            raise TaskError(self._value["error"])
+        return self._value["result"]
+
+    def __await__(self):
+        return self.get().__await__()
+
+
+class Worker:
+    """Runs registered tasks on the current event loop."""
+
+    def __init__(
+        self, broker: Broker, backend: ResultBackend, concurrency: int = 8
+    ) -> None:
+        self.broker = broker
+        self.backend = backend
+        self.concurrency = concurrency
+        self.stats: Counter = Counter()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def enqueue(self, name: str, args: Tuple[Any, ...], kwargs: Dict[str, Any]):
+        task_id = uuid4().hex
+        await self.broker.put(
+            {"id": task_id, "task": name, "payload": json.dumps([args, kwargs])}
+        )
+        self.stats["enqueued"] += 1
+        return AsyncResult(task_id, self.backend)
+
+    async def run(self) -> None:
+        """Consumes jobs until cancelled."""
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        logger.info("Worker started for %s tasks", len(registry))
+        await self.broker.consume(self.handle)
+
+    async def handle(self, jobs: List[Job]) -> None:
+        """Runs a batch, jobs of a `batch_size` task share a single call."""
+        groups: Dict[str, List[Job]] = {}
+        for job in jobs:
+            groups.setdefault(job["task"], []).append(job)
+        calls = []
+        for name, group in groups.items():
+            size = batched.get(name)
+            if size:
+                calls += [
+                    self._run_batch(name, group[i : i + size])
+                    for i in range(0, len(group), size)
+                ]
+            else:
+                calls += [self._run(job) for job in group]
+        await asyncio.gather(*calls)
+
+    async def _run(self, job: Job) -> None:
+        def arguments() -> Tuple[List[Any], Dict[str, Any]]:
+            args, kwargs = json.loads(job["payload"])
+            return args, kwargs
+
+        await self._call(job["task"], [job], arguments)
+
+    async def _run_batch(self, name: str, jobs: List[Job]) -> None:
+        def arguments() -> Tuple[List[Any], Dict[str, Any]]:
+            return [[json.loads(job["payload"])[0][0] for job in jobs]], {}
+
+        await self._call(name, jobs, arguments)
+
+    async def _call(
+        self,
+        name: str,
+        jobs: List[Job],
+        arguments: Callable[[], Tuple[List[Any], Dict[str, Any]]],
+    ) -> None:
+        """Runs a task and stores one outcome per job, an error if it has none."""
+        assert self._semaphore is not None
+        outcomes: List[Dict[str, Any]] = []
+        async with self._semaphore:
+            try:
+                func = registry[name]
+                args, kwargs = arguments()
+                result = await func(*args, **kwargs)
+                if name in batched:
+                    if len(result) != len(jobs):
+                        raise ValueError(
+                            f"returned {len(result)} results for {len(jobs)} jobs"
+                        )
+                    outcomes = [{"result": i} for i in result]
+                else:
+                    outcomes = [{"result": result}]
+                self.stats["succeeded"] += len(jobs)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.error("Task %s failed: %s", name, exc)
+                outcomes = [{"error": f"{exc.__class__.__name__}: {exc}"}] * len(jobs)
+                self.stats["failed"] += len(jobs)
+        for job, outcome in zip(jobs, outcomes):
+            await self.backend.set(job["id"], json.dumps(outcome, default=str))
+
+
+def create_worker() -> Worker:
+    concurrency = int(os.environ.get("TASK_CONCURRENCY", 8))
+    if os.environ.get("TASK_BROKER") == "memory":
+        return Worker(MemoryBroker(), MemoryResults(), concurrency)
+    redis = Lazy(lambda: aioredis.Redis.from_url(env.REDIS_URL))
+    return Worker(RedisBroker(redis), RedisResults(redis), concurrency)
+
+
+worker = create_worker()
+
+
+def task(
+    func: Optional[Callable[..., Awaitable[T]]] = None, *, batch_size: int = 0
+) -> Callable[..., Any]:
+    """
+    Registers a coroutine as a background task, calling the decorated
+    function enqueues it and returns an `AsyncResult`, `.run` calls it inline.
+
+    With `batch_size` the coroutine receives a list with the first argument of
+    up to that many queued calls and must return one result per item.
+    """
+
+    def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Any]:
+        name = f"{func.__module__}.{func.__name__}"
+        registry[name] = func
+        if batch_size:
+            batched[name] = batch_size
+
+        @wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> AsyncResult:
+            return await worker.enqueue(name, args, kwargs)
+
+        wrapper.run = func  # type: ignore
+        return wrapper
 
+    if func is None:
+        return decorator
+    return decorator(func)
 
-def task(func: Callable[..., Awaitable[T]]) -> Callable[..., Any]:
-    @wraps(func)
-    def wrapper(*args: Any, **kwargs: Any) -> None:
-        task_name = f"{func.__module__}.{func.__name__}"
-        worker.send_task(task_name, args=args, kwargs=kwargs)
 
-    return wrapper
+def discover(package: str = "aio_agents") -> List[str]:
+    """Imports every module of `package` so their tasks get registered."""
+    module = importlib.import_module(package)
+    for info in pkgutil.walk_packages(module.__path__, f"{package}."):
+        # Entry points run something when imported.
+        if info.name.endswith(".__main__"):
+            continue
+        importlib.import_module(info.name)
+    return list(registry)
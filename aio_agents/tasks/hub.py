@@ -0,0 +1,134 @@
+"""Per-process multiplexed Redis pub/sub with in-process fan-out."""
+import asyncio
+from collections import Counter
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set
+
+import aioredis
+from aiofauna.utils import setup_logging
+from aioredis.client import PubSub
+
+logger = setup_logging(__name__)
+
+
+class Subscription:
+    """
+    One in-process consumer of a channel.
+
+    Messages are buffered in a bounded queue, when a slow consumer falls
+    `maxsize` messages behind the oldest ones are dropped so it can never stall
+    the shared reader. Use as `async with hub.subscribe(channel) as sub`.
+    """
+
+    def __init__(self, hub: "SubscriptionHub", channel: str, maxsize: int) -> None:
+        self.hub = hub
+        self.channel = channel
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def put(self, message: str) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            self.hub.stats["dropped"] += 1
+        self.queue.put_nowait(message)
+
+    async def __aenter__(self) -> "Subscription":
+        await self.hub.attach(self)
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.hub.detach(self)
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        while True:
+            yield await self.queue.get()
+
+
+class SubscriptionHub:
+    """
+    Holds a single pub/sub connection for the whole process.
+
+    Channel subscriptions are reference counted: Redis is subscribed when the
+    first consumer attaches and unsubscribed when the last one detaches. A
+    single reader task fans every message out to the consumers of its channel.
+    Messages published while the connection was down are lost, the
+    `on_reconnect` callbacks run once the channels are subscribed again.
+    """
+
+    def __init__(self, redis: aioredis.Redis, maxsize: int = 256) -> None:
+        self.redis = redis
+        self.maxsize = maxsize
+        self.stats: Counter = Counter()
+        self.on_reconnect: List[Callable[[], None]] = []
+        self._consumers: Dict[str, Set[Subscription]] = {}
+        self._ps: Optional[PubSub] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def ps(self) -> PubSub:
+        if self._ps is None:
+            self._ps = self.redis.pubsub()
+        return self._ps
+
+    def subscribe(self, channel: str) -> Subscription:
+        return Subscription(self, channel, self.maxsize)
+
+    async def attach(self, subscription: Subscription) -> None:
+        async with self._lock:
+            consumers = self._consumers.setdefault(subscription.channel, set())
+            if not consumers:
+                await self.ps.subscribe(subscription.channel)
+                logger.info("Subscribed to %s", subscription.channel)
+            consumers.add(subscription)
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.create_task(self._read())
+
+    async def detach(self, subscription: Subscription) -> None:
+        async with self._lock:
+            consumers = self._consumers.get(subscription.channel, set())
+            consumers.discard(subscription)
+            if not consumers and subscription.channel in self._consumers:
+                del self._consumers[subscription.channel]
+                await self.ps.unsubscribe(subscription.channel)
+                logger.info("Unsubscribed from %s", subscription.channel)
+
+    @property
+    def info(self) -> Dict[str, int]:
+        return {
+            "channels": len(self._consumers),
+            "consumers": sum(len(c) for c in self._consumers.values()),
+            **self.stats,
+        }
+
+    async def _read(self) -> None:
+        lost = False
+        while self._consumers:
+            try:
+                if lost:
+                    await asyncio.sleep(1)
+                    async with self._lock:
+                        if self._consumers:
+                            await self.ps.subscribe(*self._consumers)
+                    lost = False
+                    self.stats["reconnects"] += 1
+                    for callback in self.on_reconnect:
+                        callback()
+                message = await self.ps.get_message(
+                    ignore_subscribe_messages=True, timeout=1.0
+                )
+            except (aioredis.ConnectionError, RuntimeError) as exc:
+                logger.error("Pub/sub connection lost: %s", exc)
+                lost = True
+                continue
+            if message is None or message.get("type") != "message":
+                continue
+            try:
+                channel = message["channel"].decode("utf-8")
+                data = message["data"].decode("utf-8")
+            except (KeyError, UnicodeDecodeError, AttributeError):
+                logger.error("Invalid message received %s", message)
+                continue
+            self.stats["messages"] += 1
+            for subscription in list(self._consumers.get(channel, ())):
+                subscription.put(data)
@@ -0,0 +1,164 @@
+"""Cross-process invalidation of in-process caches over Redis pub/sub."""
+import asyncio
+import json
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Optional, Set
+from uuid import uuid4
+
+import aioredis
+from aiofauna.utils import setup_logging
+
+from ..data.cache import caches, write_listeners
+from .hub import SubscriptionHub
+from .pubsub import hub, pool
+
+logger = setup_logging(__name__)
+
+
+class InvalidationBus:
+    """
+    Keeps the in-process caches of every worker coherent.
+
+    Cache owners `register` a namespace with an `evict(key)` callback and
+    optionally a `clear()` one. Writers `publish(namespace, *keys)` after
+    evicting locally; everything published during one event loop tick is
+    coalesced into a single message and the other workers evict those keys,
+    messages a worker sent itself are skipped.
+
+    When messages may have been lost (the subscription dropped some or the
+    hub reconnected) every registered cache is cleared. The listener is
+    restarted with a backoff if it fails.
+    """
+
+    def __init__(
+        self,
+        redis: aioredis.Redis,
+        hub: SubscriptionHub,  # pylint: disable=redefined-outer-name
+        channel: str = "cache:invalidate",
+        max_backoff: float = 30.0,
+    ) -> None:
+        self.redis = redis
+        self.hub = hub
+        self.channel = channel
+        self.max_backoff = max_backoff
+        self.origin = uuid4().hex
+        self.stats: Counter = Counter()
+        self._evict: Dict[str, Callable[[str], None]] = {}
+        self._clear: Dict[str, Callable[[], None]] = {}
+        self._pending: Dict[str, Set[str]] = defaultdict(set)
+        self._scheduled = False
+        self._sending: Set[asyncio.Task] = set()
+        self._listener: Optional[asyncio.Task] = None
+        hub.on_reconnect.append(self.clear)
+
+    def register(
+        self,
+        namespace: str,
+        evict: Callable[[str], None],
+        clear: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self._evict[namespace] = evict
+        if clear is not None:
+            self._clear[namespace] = clear
+
+    def publish(self, namespace: str, *keys: str) -> None:
+        """Queues `keys` for the message sent at the end of this loop tick."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            logger.warning("No event loop, dropped invalidation of %s", keys)
+            return
+        self._pending[namespace].update(keys)
+        if not self._scheduled:
+            self._scheduled = True
+            loop.call_soon(self._flush)
+
+    def start(self) -> None:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self.supervise())
+
+    async def supervise(self) -> None:
+        """Runs `listen` for good, caches are cleared before every restart."""
+        failures = 0
+        while True:
+            try:
+                await self.listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # pylint: disable=broad-except
+                failures += 1
+                logger.error("Invalidation listener failed: %s", exc)
+            self.stats["restarts"] += 1
+            self.clear()
+            await asyncio.sleep(min(2**failures, self.max_backoff))
+
+    async def listen(self) -> None:
+        async with self.hub.subscribe(self.channel) as subscription:
+            dropped = 0
+            async for message in subscription:
+                if subscription.dropped != dropped:
+                    dropped = subscription.dropped
+                    self.clear()
+                self.receive(message)
+
+    def receive(self, message: str) -> None:
+        try:
+            payload = json.loads(message)
+            origin, batch = payload["origin"], payload["keys"]
+        except (ValueError, KeyError, TypeError):
+            self.stats["invalid"] += 1
+            logger.error("Invalid invalidation %s", message)
+            return
+        if origin == self.origin:
+            return
+        self.stats["received"] += 1
+        for namespace, keys in batch.items():
+            evict = self._evict.get(namespace)
+            if evict is not None:
+                for key in keys:
+                    evict(key)
+                self.stats["evicted"] += len(keys)
+
+    def clear(self) -> None:
+        """Empties every registered cache, for when messages were missed."""
+        self.stats["clears"] += 1
+        for clear in self._clear.values():
+            clear()
+
+    @property
+    def info(self) -> Dict[str, int]:
+        return {"namespaces": len(self._evict), **self.stats}
+
+    def _flush(self) -> None:
+        self._scheduled = False
+        batch = {namespace: sorted(keys) for namespace, keys in self._pending.items()}
+        self._pending.clear()
+        self.stats["published"] += sum(len(keys) for keys in batch.values())
+        task = asyncio.create_task(self._send(batch))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: Dict[str, list]) -> None:
+        message = json.dumps({"origin": self.origin, "keys": batch})
+        try:
+            await self.redis.publish(self.channel, message)
+            self.stats["sent"] += 1
+        except Exception as exc:  # pylint: disable=broad-except
+            self.stats["send_errors"] += 1
+            logger.error("Publishing invalidations failed: %s", exc)
+
+
+def _evict_model(key: str) -> None:
+    name, ref = key.split(":", 1)
+    if name in caches:
+        caches[name].invalidate(ref)
+
+
+def _clear_models() -> None:
+    for cache in caches.values():
+        cache.clear()
+
+
+bus = InvalidationBus(pool, hub)
+bus.register("models", _evict_model, _clear_models)
+write_listeners.append(lambda name, ref: bus.publish("models", f"{name}:{ref}"))
@@ -1,4 +1,4 @@
-from typing import AsyncGenerator, TypeVar
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, TypeVar
 
 import aioredis
 from aiofauna.json import to_json
@@ -8,12 +8,19 @@ from aioredis.client import PubSub
 
 from ..config import env
 from ..data.models import llm
+from ..lazy import Lazy
+from .hub import SubscriptionHub
+from .streams import FunctionStream
 
 T = TypeVar("T")
 
 logger = setup_logging(__name__)
 
-pool = aioredis.Redis.from_url(env.REDIS_URL)
+pool: aioredis.Redis = Lazy(  # type: ignore
+    lambda: aioredis.Redis.from_url(env.REDIS_URL)
+)
+hub = SubscriptionHub(pool)
+function_stream = FunctionStream(pool)
 
 
 class FunctionQueue(LazyProxy[PubSub]):
@@ -21,40 +28,47 @@ class FunctionQueue(LazyProxy[PubSub]):
         """Initializes a new FunctionQueue Event Stream to catch function call event results in an asynchronous fashion."""
         self.namespace = namespace
         logger.info("Initializing FunctionQueue for %s", self.namespace)
-        self.ps = self.__load__()
 
     def __load__(self):
         """Lazy loading of the PubSub object."""
-        return pool.pubsub()
+        return hub.ps
 
     async def sub(self) -> AsyncGenerator[str, None]:
-        """Subscribes to the PubSub channel and yields messages as they come in."""
-        await self.ps.subscribe(self.namespace)
-        logger.info("Subscribed to %s", self.namespace)
-        async for message in self.ps.listen():
-            try:
-                data = message["data"]
-                yield data.decode("utf-8")
-            except (KeyError, AssertionError, UnicodeDecodeError, AttributeError):
-                logger.error("Invalid message received %s", message)
-                continue
+        """Yields messages of the channel through the process wide `hub`, the
+        Redis subscription is released once the last consumer goes away."""
+        async with hub.subscribe(self.namespace) as subscription:
+            async for message in subscription:
+                yield message
 
     @handle_errors
     async def _send(self, message: str) -> None:
-        """Protected method to send a message to the PubSub channel."""
+        """Protected method to store a message in the namespace result stream and
+        send it to the PubSub channel."""
         logger.info("Publishing message %s", message)
+        await function_stream.add_result(self.namespace, message)
         await pool.publish(self.namespace, message)
 
     @handle_errors
-    async def pub(self, message: str) -> None:
-        """Public method to send a function call result to the PubSub channel."""
-        response = await llm.function_call( 
+    async def pub(self, message: str, stream: bool = False) -> None:
+        """Public method to send function call results to the PubSub channel as each one finishes.
+
+        With `stream` the model tokens and `tool_started` progress events are
+        published too and tools start as soon as their arguments are complete.
+        """
+        calls: Callable[..., AsyncIterator[Any]] = llm.function_calls
+        if stream:
+            calls = llm.stream_function_call
+        async for response in calls(
             text=message,
             context="You are a function Orchestrator, if you are asked for your identity, who you work for or who created you, just say you were born in the cloud.",
             model="gpt-3.5-turbo-16k-0613",
-        )
-        logger.info("Sending response %s", response)
-        await self._send(to_json(response))
-        logger.info("Unsubscribing from %s", self.namespace)
-        await self.ps.unsubscribe(self.namespace)
-        logger.info("Unsubscribed from %s", self.namespace)
+        ):
+            logger.info("Sending response %s", response)
+            await self._send(to_json(response))
+
+
+async def run_function_job(job: Dict[str, str]) -> None:
+    """Runs a job enqueued on `function_stream`."""
+    await FunctionQueue(job["namespace"]).pub(
+        job["text"], stream=job.get("stream") == "1"
+    )
@@ -0,0 +1,240 @@
+"""Durable function call jobs and results on Redis Streams."""
+import asyncio
+import socket
+from collections import Counter
+from contextlib import asynccontextmanager
+from os import getpid
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import aioredis
+from aiofauna.utils import setup_logging
+
+logger = setup_logging(__name__)
+
+Entry = Tuple[str, Dict[str, str]]
+Handler = Callable[[Dict[str, str]], Awaitable[None]]
+BatchHandler = Callable[[List[Dict[str, str]]], Awaitable[None]]
+
+
+def decode(entry: Tuple[bytes, Dict[bytes, bytes]]) -> Entry:
+    entry_id, fields = entry
+    return entry_id.decode("utf-8"), {
+        key.decode("utf-8"): value.decode("utf-8") for key, value in fields.items()
+    }
+
+
+class FunctionStream:
+    """
+    Jobs are appended to a single stream read by a consumer group, so every
+    worker process shares the load and an entry is only removed from the
+    pending list once its handler succeeded. Running jobs are re-claimed
+    periodically to keep them fresh, entries idle for longer than
+    `min_idle_ms` belong to a dead consumer and are claimed by a live one, after
+    `max_deliveries` attempts they are acknowledged and dropped.
+
+    Results go to one capped stream per namespace, clients that reconnect
+    replay everything after the last id they saw.
+    """
+
+    def __init__(
+        self,
+        redis: aioredis.Redis,
+        group: str = "functions",
+        jobs_key: str = "functions:jobs",
+        maxlen: int = 1000,
+        batch_size: int = 16,
+        block_ms: int = 5000,
+        min_idle_ms: int = 60000,
+        max_deliveries: int = 3,
+    ) -> None:
+        self.redis = redis
+        self.group = group
+        self.jobs_key = jobs_key
+        self.maxlen = maxlen
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.min_idle_ms = min_idle_ms
+        self.max_deliveries = max_deliveries
+        self.consumer = f"{socket.gethostname()}-{getpid()}"
+        self.stats: Counter = Counter()
+
+    @staticmethod
+    def results_key(namespace: str) -> str:
+        return f"functions:results:{namespace}"
+
+    async def enqueue(self, **fields: str) -> str:
+        """Appends a job, returns its id."""
+        entry_id = await self.redis.xadd(
+            self.jobs_key, dict(fields.items()), maxlen=self.maxlen
+        )
+        self.stats["enqueued"] += 1
+        return entry_id.decode("utf-8")
+
+    async def add_result(self, namespace: str, message: str) -> str:
+        """Appends a result to the namespace stream, returns its id."""
+        entry_id = await self.redis.xadd(
+            self.results_key(namespace), {"data": message}, maxlen=self.maxlen
+        )
+        return entry_id.decode("utf-8")
+
+    async def replay(self, namespace: str, after: str = "0-0") -> AsyncIterator[Entry]:
+        """Yields results stored after `after` up to the current end of the
+        stream, without blocking, live ones are for the pub/sub hub."""
+        key = self.results_key(namespace)
+        while True:
+            response = await self.redis.xread({key: after}, count=self.batch_size)
+            entries = [decode(i) for _, batch in response or [] for i in batch]
+            if not entries:
+                return
+            for entry in entries:
+                yield entry
+            after = entries[-1][0]
+
+    async def ensure_group(self) -> None:
+        try:
+            await self.redis.xgroup_create(
+                self.jobs_key, self.group, id="0", mkstream=True
+            )
+        except aioredis.ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+
+    async def run(self, handler: Handler) -> None:
+        """Consumes jobs forever, `handler` receives the fields of each one."""
+        await self._consume(lambda entries: self._process(entries, handler))
+
+    async def run_batches(self, handler: BatchHandler) -> None:
+        """Consumes jobs forever, `handler` receives every batch read at once
+        and the whole batch is acknowledged when it returns."""
+        await self._consume(lambda entries: self._process_batch(entries, handler))
+
+    async def _consume(self, process: Callable[[List[Entry]], Awaitable[None]]):
+        await self.ensure_group()
+        logger.info("Consumer %s joined group %s", self.consumer, self.group)
+        while True:
+            try:
+                await process(await self._reclaim())
+                response = await self.redis.xreadgroup(
+                    self.group,
+                    self.consumer,
+                    {self.jobs_key: ">"},
+                    count=self.batch_size,
+                    block=self.block_ms,
+                )
+                await process(
+                    [decode(i) for _, batch in response or [] for i in batch]
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.error("Stream consumer %s failed: %s", self.group, exc)
+                await asyncio.sleep(1)
+
+    @asynccontextmanager
+    async def _holding(self, ids: Sequence[str]) -> AsyncIterator[None]:
+        """Claims `ids` again every third of `min_idle_ms` while they run, so
+        jobs slower than that are not handed to another consumer."""
+
+        async def keepalive() -> None:
+            while True:
+                await asyncio.sleep(self.min_idle_ms / 3000)
+                try:
+                    await self.redis.xclaim(
+                        self.jobs_key,
+                        self.group,
+                        self.consumer,
+                        0,
+                        list(ids),
+                        justid=True,
+                    )
+                except Exception as exc:  # pylint: disable=broad-except
+                    logger.error("Keeping %s jobs claimed failed: %s", len(ids), exc)
+
+        task = asyncio.create_task(keepalive())
+        try:
+            yield
+        finally:
+            task.cancel()
+
+    async def _process(self, entries: List[Entry], handler: Handler) -> None:
+        if not entries:
+            return
+        async with self._holding([entry_id for entry_id, _ in entries]):
+            results = await asyncio.gather(
+                *[handler(fields) for _, fields in entries], return_exceptions=True
+            )
+        done = []
+        for (entry_id, _), result in zip(entries, results):
+            if isinstance(result, Exception):
+                logger.error("Job %s failed: %s", entry_id, result)
+                self.stats["failed"] += 1
+            else:
+                done.append(entry_id)
+        await self._ack(done)
+
+    async def _process_batch(
+        self, entries: List[Entry], handler: BatchHandler
+    ) -> None:
+        if not entries:
+            return
+        async with self._holding([entry_id for entry_id, _ in entries]):
+            await handler([fields for _, fields in entries])
+        await self._ack([entry_id for entry_id, _ in entries])
+
+    async def _ack(self, ids: List[str]) -> None:
+        if ids:
+            await self.redis.xack(self.jobs_key, self.group, *ids)
+            self.stats["acked"] += len(ids)
+
+    async def _reclaim(self) -> List[Entry]:
+        """Claims jobs other consumers left pending for too long."""
+        # IDLE filters on the server, so jobs held by live consumers at the
+        # head of the pending list do not hide the stale ones behind them.
+        stale = await self.redis.execute_command(
+            "XPENDING",
+            self.jobs_key,
+            self.group,
+            "IDLE",
+            self.min_idle_ms,
+            "-",
+            "+",
+            self.batch_size,
+            parse_detail=True,
+        )
+        dead = [
+            i["message_id"]
+            for i in stale
+            if i["times_delivered"] >= self.max_deliveries
+        ]
+        if dead:
+            logger.error("Dropping %s after %s deliveries", dead, self.max_deliveries)
+            await self.redis.xack(self.jobs_key, self.group, *dead)
+            self.stats["dead"] += len(dead)
+        retry = [i["message_id"] for i in stale if i["message_id"] not in dead]
+        if not retry:
+            return []
+        claimed = await self.redis.xclaim(
+            self.jobs_key, self.group, self.consumer, self.min_idle_ms, retry
+        )
+        # Entries trimmed by MAXLEN come back without fields and can never
+        # run, they are acknowledged instead of failing `decode`.
+        trimmed = [i[0] for i in claimed if i[0] is not None and i[1] is None]
+        if trimmed:
+            await self._ack(trimmed)
+            self.stats["trimmed"] += len(trimmed)
+        entries = [decode(i) for i in claimed if i[0] is not None and i[1] is not None]
+        self.stats["reclaimed"] += len(entries)
+        return entries
+
+    @property
+    def info(self) -> Dict[str, int]:
+        return dict(self.stats)
@@ -1,13 +1,18 @@
-from typing import Any, List, Optional
+from typing import Any, ClassVar, List, Optional, Tuple
 
-import openai
 from aiofauna import *
 from pydantic import Field
 
 from ..schemas import FunctionDocument
+from ..services.cache import cached_chat_completion
 
 
-async def chat_completion(text: str, context: Optional[str] = None) -> str:
+async def chat_completion(
+	text: str,
+	context: Optional[str] = None,
+	temperature: float = 1,
+	cache: Optional[bool] = None,
+) -> str:
 	if context is not None:
 		messages = [
 			{"role": "user", "content": text},
@@ -15,8 +20,11 @@ async def chat_completion(text: str, context: Optional[str] = None) -> str:
 		]
 	else:
 		messages = [{"role": "user", "content": text}]
-	response = await openai.ChatCompletion.acreate(
-		model="gpt-3.5-turbo-16k-0613", messages=messages
+	response = await cached_chat_completion(
+		cache=cache,
+		model="gpt-3.5-turbo-16k-0613",
+		messages=messages,
+		temperature=temperature,
 	)
 	return response["choices"][0]["message"]["content"]
 
@@ -24,6 +32,9 @@ async def chat_completion(text: str, context: Optional[str] = None) -> str:
 class Quiz(FunctionDocument):
 	"""Generates a set of questions of a given topic."""
 
+	cache_ttl: ClassVar[Optional[float]] = 60 * 60 * 24
+	cache_key: ClassVar[Optional[Tuple[str, ...]]] = ("topic", "quantity", "questions")
+
 	topic: str = Field(description="Topic to generate questions about.")
 	quantity: int = Field(
 		default=5, gt=0, lt=11, description="Number of questions to generate."
@@ -1,10 +1,12 @@
 from dataclasses import field
 
 from aiofauna import *
+from aiofauna import APIClient
 from pydantic import Field
 
 from ..config import env
 from ..data import *
+from ..lazy import Lazy
 from ..schemas import *
 from ..utils import nginx_config, parse_env_string, random_port
 
@@ -46,7 +48,7 @@ async def get_database_key(ref: str):
 
 
 class DockerClient(APIClient):
-    base_url: str = field(default=env.DOCKER_URL)
+    base_url: str = field(default_factory=lambda: env.DOCKER_URL)
     headers: Dict[str, str] = field(
         default_factory=lambda: {"Accept": "application/json"}
     )
@@ -133,8 +135,8 @@ class CloudFlareClient(APIClient):
         return DNSRecord(**response["result"])
 
 
-docker = DockerClient()  # pylint: disable=E1120
-cloudflare = CloudFlareClient()  # pylint: disable=E1120
+docker: DockerClient = Lazy(DockerClient)  # type: ignore
+cloudflare: CloudFlareClient = Lazy(CloudFlareClient)  # type: ignore
 
 
 class CodeServer(FunctionDocument):
@@ -1,6 +1,5 @@
 from aiofauna import *
 from aiohttp import ClientSession
-from bs4 import BeautifulSoup
 
 from ..schemas import *
 
@@ -18,6 +17,8 @@ BROWSER_HEADERS = {
 async def search_google(
 	text: str, lang: str = "en", limit: int = 10
 ) -> List[SearchResult]:
+	from bs4 import BeautifulSoup  # pylint: disable=import-outside-toplevel
+
 	async with ClientSession(headers=BROWSER_HEADERS) as session:
 		async with session.get(
 			f"https://www.google.com/search?q={text}&hl={lang}&num={limit}"
@@ -37,6 +38,10 @@ class GoogleSearch(FunctionDocument):
 	Searches Google with user text input as query and returns the results.
 	"""
 
+	timeout: ClassVar[float] = 10
+	cache_ttl: ClassVar[Optional[float]] = 60 * 60
+	cache_key: ClassVar[Optional[Tuple[str, ...]]] = ("query", "lang", "limit")
+
 	query: str = Field(...)
 	lang: str = Field(default="en")
 	limit: int = Field(default=10)
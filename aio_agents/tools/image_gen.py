@@ -6,6 +6,10 @@ from ..utils import s3
 
 
 class ImageGeneration(FunctionDocument):
+	timeout: ClassVar[float] = 90
+	cache_ttl: ClassVar[Optional[float]] = 60 * 60 * 24
+	cache_key: ClassVar[Optional[Tuple[str, ...]]] = ("prompt",)
+
 	prompt: str = Field(..., description="The user input text")
 	url: Optional[str] = Field(default=None, description="The url of the image that was generated")
 
@@ -3,17 +3,20 @@ from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 from aiofauna import FaunaModel
-from boto3 import Session
 from pydantic import Field  # pylint: disable=E0611
 
 from ..config import AWSCredentials
+from ..lazy import Lazy
 from ..schemas import *
 
-credentials = AWSCredentials().dict()
 
-aws = Session(**credentials)
+def ses_client():
+	from boto3 import Session  # pylint: disable=import-outside-toplevel
 
-ses = aws.client("ses")
+	return Session(**AWSCredentials().dict()).client("ses")
+
+
+ses = Lazy(ses_client)
 
 
 class ContactForm(FunctionDocument, FaunaModel):
@@ -1,24 +1,47 @@
 import functools
-import io
+import heapq
 import re
 import socket
 import subprocess
 from collections import Counter
-from typing import List, Tuple
+from operator import itemgetter
+from typing import Any, Dict, Iterable, Iterator, List, Union
 
-import numpy as np
-import spacy
 from aiofauna import *
-from aiofauna.typedefs import Vector
-from boto3 import Session
-from pydub import AudioSegment
-from scipy.io import wavfile
+from aiofauna.docs import FileField
 
 from .config import env
 from .data import *
+from .lazy import Lazy, aws_client, warmup
 
-s3 = Session().client("s3")
-nlp = spacy.load("en_core_web_sm")
+s3 = aws_client("s3")
+
+
+def load_nlp():
+    """
+    Word counts only read lexical attributes (`is_alpha`, `is_stop`), so every
+    trained component is left out and only the tokenizer runs.
+    """
+    import spacy  # pylint: disable=import-outside-toplevel
+
+    return spacy.load(
+        "en_core_web_sm",
+        exclude=[
+            "tok2vec",
+            "tagger",
+            "parser",
+            "senter",
+            "attribute_ruler",
+            "lemmatizer",
+            "ner",
+        ],
+    )
+
+
+nlp = Lazy(load_nlp)
+warmup.register("env", env)  # type: ignore
+warmup.register("spacy", nlp)
+warmup.register("boto3", s3)
 
 
 def random_port() -> int:
@@ -106,53 +129,68 @@ server {{
     )
 
 
-async def upload_handler(file: FileField, user: str, namespace: str):
-    """Uploads a file to S3 and returns a FileData object"""
+def upload_file(file: FileField, user: str, namespace: str) -> "FileData":
+    """Uploads a file to S3 and returns its FileData, not saved yet"""
     key = f"{user}/{namespace}/{file.filename}"
     data = file.file.read()
     s3.put_object(Bucket=env.AWS_S3_BUCKET, Key=key, Body=data)
-    return await FileData(
+    return FileData(
         user=user,
         namespace=namespace,
         name=file.filename,
         size=len(data),
         content_type=file.content_type,
         url=f"https://{env.AWS_S3_BUCKET}.s3.amazonaws.com/{key}",
-    ).save()
-
-
-def word_cloud(text: str):
-    """Generates a word cloud from the given texts"""
-    word_count = Counter()
-    doc = nlp(text)
-    words = [
-        token.text.lower() for token in doc if token.is_alpha and not token.is_stop
-    ]
-    word_count.update(words)
-    sorted_word_count = sorted(word_count.items(), key=lambda x: x[1], reverse=True)
-    return [{"word": word, "count": count} for word, count in sorted_word_count[:25]]
+    )
 
 
-def mp3_to_vect(binary_audio: bytes) -> Tuple[Vector, int]:
-    """
-    Converts the given audio to a vector
-    """
-    audio = AudioSegment.from_mp3(io.BytesIO(binary_audio))
-    duration = audio.duration_seconds
-    if audio.channels == 2:
-        audio = audio.set_channels(1)
-    wav_data = io.BytesIO(binary_audio)
-    audio.export(wav_data, format="wav")
-    wav_data.seek(0)
-    _, audio_sample = wavfile.read(wav_data)
-    fft_sample = np.fft.fft(audio_sample)
-    combined_fft = np.concatenate((np.real(fft_sample), np.imag(fft_sample)))
-    step_size = len(combined_fft) // 1536
-    subsampled_embedding = combined_fft[::step_size][:1536]
-    normalized_embedding = (
-        subsampled_embedding / np.linalg.norm(subsampled_embedding)
-    ).tolist()
-    return normalized_embedding, duration
+async def upload_handler(file: FileField, user: str, namespace: str):
+    """Uploads a file to S3 and returns a FileData object"""
+    return await upload_file(file=file, user=user, namespace=namespace).save()
+
+
+def split_text(text: str, size: int = 100_000) -> Iterator[str]:
+    """Splits `text` on whitespace into pieces shorter than spaCy's `max_length`."""
+    start = 0
+    while start < len(text):
+        end = start + size
+        if end < len(text):
+            space = text.rfind(" ", start, end)
+            end = space if space > start else end
+        yield text[start:end]
+        start = end
+
+
+class WordCounter:
+    """Incremental counts of alphabetic, non stop-word tokens."""
+
+    def __init__(self, batch_size: int = 64, n_process: int = 1) -> None:
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.counts: Counter = Counter()
+
+    def update(self, texts: Iterable[str]) -> "WordCounter":
+        chunks = (chunk for text in texts for chunk in split_text(text))
+        for doc in nlp.pipe(
+            chunks, batch_size=self.batch_size, n_process=self.n_process
+        ):
+            self.counts.update(
+                token.lower_ for token in doc if token.is_alpha and not token.is_stop
+            )
+        return self
+
+    def top(self, n: int = 25) -> List[Dict[str, Any]]:
+        return [
+            {"word": word, "count": count}
+            for word, count in heapq.nlargest(n, self.counts.items(), key=itemgetter(1))
+        ]
+
+
+def word_cloud(texts: Union[str, Iterable[str]], top: int = 25, n_process: int = 1):
+    """Generates a word cloud from the given texts (a string or its pages)"""
+    if isinstance(texts, str):
+        texts = [texts]
+    return WordCounter(n_process=n_process).update(texts).top(top)
 
 
 def snakify(name: str) -> str:
@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+from aio_agents.tasks.background import (
+    MemoryBroker,
+    MemoryResults,
+    TaskError,
+    Worker,
+    task,
+)
+
+batches = []
+active = {"now": 0, "peak": 0}
+
+
+@task
+async def add(a, b):
+    return a + b
+
+
+@task(batch_size=4)
+async def double(items):
+    batches.append(len(items))
+    return [i * 2 for i in items]
+
+
+@task(batch_size=4)
+async def first_only(items):
+    return items[:1]
+
+
+@task
+async def fail():
+    raise RuntimeError("boom")
+
+
+@task
+async def slow():
+    active["now"] += 1
+    active["peak"] = max(active["peak"], active["now"])
+    await asyncio.sleep(0.01)
+    active["now"] -= 1
+
+
+def name(func):
+    return f"{func.__module__}.{func.__name__}"
+
+
+def run(scenario, concurrency=8, start_first=True):
+    """Runs `scenario(worker, start)` against an in-memory worker."""
+
+    async def main():
+        worker = Worker(MemoryBroker(), MemoryResults(), concurrency)
+        consumer = None
+
+        def start():
+            nonlocal consumer
+            consumer = asyncio.create_task(worker.run())
+
+        if start_first:
+            start()
+        try:
+            return await scenario(worker, start)
+        finally:
+            if consumer is not None:
+                consumer.cancel()
+
+    return asyncio.run(main())
+
+
+def test_enqueue_returns_result():
+    async def scenario(worker, _):
+        result = await worker.enqueue(name(add), (1, 2), {})
+        return await result.get(timeout=1)
+
+    assert run(scenario) == 3
+
+
+def test_batched_jobs_share_calls():
+    batches.clear()
+
+    async def scenario(worker, start):
+        results = [await worker.enqueue(name(double), (i,), {}) for i in range(8)]
+        start()
+        return [await result.get(timeout=1) for result in results]
+
+    assert run(scenario, start_first=False) == [i * 2 for i in range(8)]
+    assert batches == [4, 4]
+
+
+def test_failure_is_reported_and_worker_keeps_running():
+    async def scenario(worker, _):
+        failed = await worker.enqueue(name(fail), (), {})
+        with pytest.raises(TaskError, match="boom"):
+            await failed.get(timeout=1)
+        no_items = await worker.enqueue(name(double), (), {"items": [1]})
+        with pytest.raises(TaskError):
+            await no_items.get(timeout=1)
+        return await (await worker.enqueue(name(add), (2, 2), {})).get(timeout=1)
+
+    assert run(scenario) == 4
+
+
+def test_batch_with_missing_results_fails_every_job():
+    async def scenario(worker, start):
+        results = [await worker.enqueue(name(first_only), (i,), {}) for i in range(3)]
+        start()
+        for result in results:
+            with pytest.raises(TaskError, match="1 results for 3 jobs"):
+                await result.get(timeout=1)
+
+    run(scenario, start_first=False)
+
+
+def test_concurrency_is_bounded():
+    active.update(now=0, peak=0)
+
+    async def scenario(worker, start):
+        results = [await worker.enqueue(name(slow), (), {}) for _ in range(6)]
+        start()
+        for result in results:
+            await result.get(timeout=1)
+
+    run(scenario, concurrency=2, start_first=False)
+    assert active["peak"] == 2
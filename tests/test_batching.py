@@ -0,0 +1,63 @@
+import asyncio
+
+import openai
+import pytest
+
+from aio_agents.services import batching
+from aio_agents.services.batching import EmbeddingBatcher
+
+requests = []
+
+
+async def fake_embedding_request(model, input):
+    requests.append(list(input))
+    if len(input) > 1 and "bad" in input:
+        raise openai.error.InvalidRequestError("rejected", None)
+    if input == ["bad"]:
+        raise openai.error.InvalidRequestError("bad input", None)
+    return {
+        "data": [
+            {"index": index, "embedding": [float(len(text))]}
+            for index, text in enumerate(input)
+        ]
+    }
+
+
+@pytest.fixture(autouse=True)
+def fake_api(monkeypatch):
+    requests.clear()
+    monkeypatch.setattr(batching, "create_embedding_request", fake_embedding_request)
+    monkeypatch.setattr(batching, "count_tokens", lambda text, _: len(text.split()))
+
+
+def test_concurrent_inputs_share_one_request():
+    async def main():
+        batcher = EmbeddingBatcher()
+        return await asyncio.gather(*[batcher.embed("x" * i) for i in range(1, 4)])
+
+    assert asyncio.run(main()) == [[1.0], [2.0], [3.0]]
+    assert requests == [["x", "xx", "xxx"]]
+
+
+def test_rejected_batch_fails_only_the_bad_input():
+    async def main():
+        batcher = EmbeddingBatcher()
+        return await asyncio.gather(
+            batcher.embed("ok"), batcher.embed("bad"), return_exceptions=True
+        )
+
+    good, bad = asyncio.run(main())
+    assert good == [2.0]
+    assert isinstance(bad, openai.error.InvalidRequestError)
+    assert requests[0] == ["ok", "bad"]
+
+
+def test_oversize_input_is_refused_before_queuing():
+    async def main():
+        batcher = EmbeddingBatcher(max_input_tokens=3)
+        with pytest.raises(ValueError):
+            await batcher.embed("many words in this input")
+        return batcher.stats["oversize"]
+
+    assert asyncio.run(main()) == 1
+    assert requests == []
@@ -0,0 +1,242 @@
+"""
+Microbenchmarks of the bulk model APIs against `StandIn`, a local Fauna that
+evaluates the FQL the models send and answers after a fixed round trip.
+"""
+import asyncio
+import json
+from itertools import count
+from time import perf_counter
+
+import pytest
+from aiofauna import FaunaModel
+from aiofauna.json import to_json
+
+from aio_agents.data import BookOrDocument, DataLoader, User, WordCount, caches
+
+LATENCY = 0.002
+N = 50
+
+
+class StandIn:
+    """In memory Fauna, counts the queries and the bytes of their results."""
+
+    def __init__(self, latency=LATENCY):
+        self.latency = latency
+        self.queries = 0
+        self.payload = 0
+        self.documents = {}
+        self._ids = count(10**17)
+        self._ts = count(1_700_000_000_000_000)
+
+    async def query(self, expr):
+        self.queries += 1
+        await asyncio.sleep(self.latency)
+        result = self.eval(json.loads(to_json(expr)), {})
+        self.payload += len(json.dumps(result))
+        return result
+
+    def eval(self, expr, env):
+        if isinstance(expr, list):
+            return [self.eval(i, env) for i in expr]
+        if not isinstance(expr, dict) or "@ref" in expr:
+            return expr
+        if "object" in expr:
+            return {k: self.eval(v, env) for k, v in expr["object"].items()}
+        if "var" in expr:
+            return env[expr["var"]]
+        if "let" in expr:
+            env = dict(env)
+            for binding in expr["let"]:
+                for name, value in binding.items():
+                    env[name] = self.eval(value, env)
+            return self.eval(expr["in"], env)
+        if "if" in expr:
+            branch = "then" if self.eval(expr["if"], env) else "else"
+            return self.eval(expr[branch], env)
+        if "exists" in expr:
+            return bool(self.resolve(self.eval(expr["exists"], env)))
+        if "get" in expr:
+            return self.resolve(self.eval(expr["get"], env))[0]
+        if "match" in expr:
+            return {"@set": [expr["match"]["index"], self.eval(expr["terms"], env)]}
+        if "reverse" in expr:
+            return {"@set": self.eval(expr["reverse"], env)["@set"] + ["reverse"]}
+        if "ref" in expr:
+            return self.ref(expr["ref"]["collection"], expr["id"])
+        if "select" in expr:
+            value = self.eval(expr["from"], env)
+            for key in expr["select"]:
+                if not isinstance(value, dict) or key not in value:
+                    return self.eval(expr["default"], env)
+                value = value[key]
+            return value
+        if "create" in expr:
+            ref = self.ref(expr["create"]["collection"], str(next(self._ids)))
+            return self.write(ref, self.eval(expr["params"], env)["data"])
+        if "update" in expr:
+            ref = self.eval(expr["update"], env)
+            document = self.resolve(ref)[0]
+            data = {**document["data"], **self.eval(expr["params"], env)["data"]}
+            return self.write(ref, data)
+        if "paginate" in expr:
+            return self.paginate(self.eval(expr["paginate"], env), expr)
+        if "map" in expr:
+            collection = self.eval(expr["collection"], env)
+            items = collection["data"] if isinstance(collection, dict) else collection
+            names = expr["map"]["lambda"]
+            mapped = []
+            for item in items:
+                scope = dict(env)
+                if isinstance(names, list):
+                    scope.update(zip(names, item))
+                else:
+                    scope[names] = item
+                mapped.append(self.eval(expr["map"]["expr"], scope))
+            if isinstance(collection, dict):
+                return {**collection, "data": mapped}
+            return mapped
+        raise NotImplementedError(expr)
+
+    def ref(self, collection, id_):
+        return {"@ref": {"id": id_, "collection": collection}}
+
+    def write(self, ref, data):
+        document = {"ref": ref, "ts": next(self._ts), "data": data}
+        self.documents[ref["@ref"]["id"]] = document
+        return document
+
+    def resolve(self, value):
+        """The documents a ref or a set of `<collection>_<field>` points to."""
+        if "@ref" in value:
+            document = self.documents.get(value["@ref"]["id"])
+            return [document] if document else []
+        index, terms, *reverse = value["@set"]
+        collection, field = index.split("_")[:2]
+        # Like Fauna, documents without a value for the terms are not indexed.
+        found = [
+            document
+            for document in self.documents.values()
+            if document["ref"]["@ref"]["collection"] == collection
+            and terms is not None
+            and document["data"].get(field) == terms
+        ]
+        return found[::-1] if reverse else found
+
+    def paginate(self, value, expr):
+        refs = [document["ref"] for document in self.resolve(value)]
+        start = refs.index(expr["after"][0]) if expr.get("after") else 0
+        page = {"data": refs[start : start + expr["size"]]}
+        if start + expr["size"] < len(refs):
+            page["after"] = [refs[start + expr["size"]]]
+        return page
+
+
+@pytest.fixture()
+def fauna(monkeypatch):
+    standin = StandIn()
+    monkeypatch.setattr(FaunaModel, "client", classmethod(lambda cls: standin))
+    caches.clear()
+    yield standin
+    caches.clear()
+
+
+def timed(coroutine):
+    start = perf_counter()
+    result = asyncio.run(coroutine)
+    return result, perf_counter() - start
+
+
+def users(start=0):
+    return [User(name=f"user {i}", sub=f"sub-{i}") for i in range(start, start + N)]
+
+
+def books(words=5):
+    cloud = [WordCount(word=f"word{i}", count=i) for i in range(words)]
+    return [
+        BookOrDocument(namespace="ns", title=f"book {i}", wordcloud=cloud)
+        for i in range(N)
+    ]
+
+
+def test_save_many_is_one_transaction(fauna):
+    async def one_by_one():
+        return [await user.save() for user in users()]
+
+    saved, looped = timed(one_by_one())
+    # `save` looks up every unique field before it creates the document.
+    assert fauna.queries == 2 * N
+
+    fauna.queries = 0
+    bulk, batched = timed(User.save_many(users(N)))
+    assert fauna.queries == 1
+    assert [user.sub for user in bulk] == [f"sub-{i}" for i in range(N, 2 * N)]
+    assert all(len(user.ref) == 18 for user in bulk)
+    assert batched * 5 < looped
+
+    again = asyncio.run(User.save_many([saved[0], User(name="x", sub="sub-1")]))
+    assert [user.ref for user in again] == [saved[0].ref, saved[1].ref]
+    assert len(fauna.documents) == 2 * N
+
+
+def test_save_many_invalidates_cached_updates(fauna):
+    async def main():
+        user = await User(name="before", sub="s").save()
+        await User.get(user.ref)
+        user.name = "after"
+        await User.save_many([user])
+        return await User.get(user.ref)
+
+    assert asyncio.run(main()).name == "after"
+
+
+def test_get_many_is_one_query(fauna):
+    saved = asyncio.run(BookOrDocument.save_many(books()))
+    refs = [book.ref for book in saved] + ["0" * 18]
+    assert len(set(refs)) == N + 1
+
+    async def one_by_one():
+        return [await BookOrDocument.get(ref) for ref in refs[:-1]]
+
+    fauna.queries = 0
+    looped_books, looped = timed(one_by_one())
+    assert fauna.queries == N
+
+    fauna.queries = 0
+    bulk, batched = timed(BookOrDocument.get_many(refs))
+    assert fauna.queries == 1
+    assert bulk[:-1] == looped_books
+    assert bulk[-1] is None
+    assert batched * 5 < looped
+
+
+def test_get_many_serves_the_model_cache(fauna):
+    refs = [user.ref for user in asyncio.run(User.save_many(users()))]
+
+    async def main():
+        loader = DataLoader(User)
+        first = await loader.load_many(refs)
+        queries = fauna.queries
+        second = await User.get_many(refs[::-1])
+        return first, second, fauna.queries - queries
+
+    fauna.queries = 0
+    first, second, queries = asyncio.run(main())
+    assert fauna.queries == 1
+    assert queries == 0
+    assert second == first[::-1]
+    assert caches["user"].stats["hits"] == N
+
+
+def test_projected_find_many_reads_less(fauna):
+    asyncio.run(BookOrDocument.save_many(books(words=200)))
+
+    fauna.payload = 0
+    full = asyncio.run(BookOrDocument.find_many(limit=N, namespace="ns"))
+    full_payload, fauna.payload = fauna.payload, 0
+    projected = asyncio.run(
+        BookOrDocument.find_many(limit=N, fields=["title"], namespace="ns")
+    )
+    assert len(full) == N
+    assert [i["title"] for i in projected] == [book.title for book in full]
+    assert {"ref", "ts", "title"} == set(projected[0])
+    assert fauna.payload * 20 < full_payload
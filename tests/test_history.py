@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from aio_agents.data import ChatMessage, ConversationSummary
+from aio_agents.helpers import history
+from aio_agents.helpers.history import ConversationManager, ConversationWindow
+
+stored = {}
+
+
+class FakeLLM:
+    def __init__(self):
+        self.calls = 0
+
+    async def chat(self, text, context, temperature):
+        self.calls += 1
+        return f"summary {self.calls}"
+
+
+async def store(namespace, summary, through):
+    stored[namespace] = ConversationSummary(
+        namespace=namespace, summary=summary, through=through
+    )
+
+
+async def find_unique(namespace):
+    return stored.get(namespace)
+
+
+def message(i):
+    owner = "agent" if i % 2 else "user"
+    return ChatMessage(namespace="ns", owner=owner, content=f"m{i}", ts=str(i))
+
+
+@pytest.fixture(autouse=True)
+def fakes(monkeypatch):
+    stored.clear()
+    monkeypatch.setattr(history, "count_tokens", lambda text: len(text))
+    monkeypatch.setattr(ConversationSummary, "store", store)
+    monkeypatch.setattr(ConversationSummary, "find_unique", find_unique)
+
+
+def test_the_prompt_is_not_repeated_in_the_history():
+    window = ConversationWindow(namespace="ns", llm=FakeLLM())
+    window.append("assistant", "hello")
+    window.append("user", "question")
+    assert window.messages("question") == [{"role": "assistant", "content": "hello"}]
+    assert len(window.messages("other")) == 2
+
+
+def test_hydration_reuses_the_stored_summary(monkeypatch):
+    async def latest(namespace, limit):
+        return [message(i) for i in range(1, 13)]
+
+    monkeypatch.setattr(ChatMessage, "latest", latest)
+
+    async def main():
+        first = ConversationManager(llm=FakeLLM())
+        window = await first.get("ns")
+        await window._task
+        second = ConversationManager(llm=FakeLLM())
+        return window, await second.get("ns"), second.llm
+
+    window, hydrated, llm = asyncio.run(main())
+    assert [t["content"] for t in window.turns] == [f"m{i}" for i in range(5, 13)]
+    assert stored["ns"].through == "4"
+    assert hydrated.summary == "summary 1"
+    assert [t["content"] for t in hydrated.turns] == [f"m{i}" for i in range(5, 13)]
+    assert llm.calls == 0
+
+
+def test_evicted_windows_are_hydrated_again(monkeypatch):
+    hydrations = []
+
+    async def latest(namespace, limit):
+        hydrations.append(namespace)
+        return []
+
+    monkeypatch.setattr(ChatMessage, "latest", latest)
+
+    async def main():
+        manager = ConversationManager(llm=FakeLLM())
+        await manager.get("ns")
+        await manager.get("ns")
+        manager.evict("ns")
+        await manager.get("ns")
+
+    asyncio.run(main())
+    assert hydrations == ["ns", "ns"]
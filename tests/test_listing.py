@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from aio_agents.data.pagination import Page
+from aio_agents.routes.listing import NDJSON, listing, query_param
+
+ITEMS = [{"n": i} for i in range(7)]
+
+
+async def fetch(limit, after):
+    start = int(after or 0)
+    end = start + limit
+    return Page(data=ITEMS[start:end], after=str(end) if end < len(ITEMS) else None)
+
+
+async def handler(request):
+    response = await listing(request, fetch)
+    if isinstance(response, web.StreamResponse):
+        return response
+    if isinstance(response, list):
+        return web.json_response(response)
+    return web.json_response(response.dict())
+
+
+async def params(request):
+    return web.json_response(
+        {
+            "limit": query_param(request, "limit", 50),
+            "after": query_param(request, "after", ""),
+        }
+    )
+
+
+def get(path, headers=None):
+    async def main():
+        app = web.Application()
+        app.router.add_get("/", handler)
+        app.router.add_get("/params", params)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.get(path, headers=headers)
+            content_type = response.headers["Content-Type"]
+            return response.status, content_type, await response.text()
+
+    return asyncio.run(main())
+
+
+def test_omitted_parameters_take_their_defaults():
+    _, _, body = get("/params")
+    assert json.loads(body) == {"limit": 50, "after": ""}
+    _, _, body = get("/params?limit=3&after=x")
+    assert json.loads(body) == {"limit": 3, "after": "x"}
+
+
+def test_invalid_parameters_are_rejected():
+    status, _, body = get("/params?limit=abc")
+    assert status == 400
+    assert json.loads(body)["message"] == "Invalid limit: abc"
+
+
+def test_pages_follow_the_cursor():
+    _, _, body = get("/?limit=3")
+    assert json.loads(body) == {"data": ITEMS[:3], "after": "3"}
+    _, _, body = get("/?limit=3&after=6")
+    assert json.loads(body) == {"data": ITEMS[6:], "after": None}
+
+
+def test_unpaged_requests_get_the_bare_array():
+    _, _, body = get("/")
+    assert json.loads(body) == ITEMS
+
+
+def test_ndjson_streams_every_page_from_the_cursor():
+    _, content_type, body = get("/?limit=2&after=1", headers={"Accept": NDJSON})
+    assert content_type.startswith(NDJSON)
+    assert [json.loads(line) for line in body.splitlines()] == ITEMS[1:]
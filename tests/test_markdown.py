@@ -0,0 +1,91 @@
+import re
+
+from aio_agents.helpers.markdown import IncrementalMarkdown, render_markdown
+
+ANSWER = """# Plan
+
+Read the [docs][guide] first, then run:
+
+```python
+print("hello")
+```
+
+- one
+- two
+
+> quoted *text*
+
+Done.
+"""
+
+LATE_REFERENCE = """See [the guide][guide] and [this][].
+
+Some more text.
+
+[guide]: https://example.com/guide "Guide"
+[this]: https://example.com/this
+"""
+
+
+NUMBERED = """Steps:
+
+1. install
+
+2. configure
+   the *server*
+
+3. run
+
+> note
+#quoted
+
+Thanks
+"""
+
+
+def tokens(text):
+    """Splits `text` the way a model streams it, words and punctuation apart."""
+    return re.findall(r"\w+|[^\w]", text)
+
+
+def split(text, size):
+    return [text[start : start + size] for start in range(0, len(text), size)]
+
+
+def stream(chunks):
+    """Feeds `chunks` one by one and rebuilds the HTML from the events."""
+    markdown = IncrementalMarkdown()
+    committed, pending = "", ""
+    for chunk in chunks:
+        for event, html in markdown.feed(chunk):
+            if event == "reset":
+                committed = ""
+            elif event == "commit":
+                committed += html
+            else:
+                pending = html
+        assert committed + pending == markdown.html
+    return markdown.html
+
+
+def test_streamed_output_equals_full_render():
+    for size in (1, 3, 7, 64, len(ANSWER)):
+        assert stream(split(ANSWER, size)) == render_markdown(ANSWER)
+
+
+def test_late_reference_definitions_relink_committed_blocks():
+    for size in (1, 5, 16, len(LATE_REFERENCE)):
+        html = stream(split(LATE_REFERENCE, size))
+        assert html == render_markdown(LATE_REFERENCE)
+        assert 'href="https://example.com/guide"' in html
+
+
+def test_references_of_committed_blocks_apply_to_later_ones():
+    text = "[guide]: https://example.com\n\nintro\n\nSee [guide].\n"
+    assert stream(split(text, 4)) == render_markdown(text)
+
+
+def test_numbered_list_streamed_token_by_token():
+    html = stream(tokens(NUMBERED))
+    assert html == render_markdown(NUMBERED)
+    assert "start=" not in html